@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+
+from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio,
+}
+
+
+def describe(msg):
+    """JSON-friendly description of one album part (stored on broadcast jobs)."""
+    if msg.photo:
+        kind, file_id = 'photo', msg.photo[-1].file_id
+    elif msg.video:
+        kind, file_id = 'video', msg.video.file_id
+    elif msg.document:
+        kind, file_id = 'document', msg.document.file_id
+    elif msg.audio:
+        kind, file_id = 'audio', msg.audio.file_id
+    else:
+        return None
+    return {'type': kind, 'file_id': file_id, 'caption': msg.caption_html if msg.caption else None}
+
+
+def build_media(items, first_caption=None):
+    """InputMedia list for send_media_group; first_caption replaces the first part's caption."""
+    media = []
+    for i, item in enumerate(items):
+        caption = first_caption if i == 0 and first_caption is not None else item['caption']
+        media.append(MEDIA_TYPES[item['type']](item['file_id'], caption=caption, parse_mode='HTML'))
+    return media
+
+
+class AlbumCollector:
+    """Buffers the parts of a media group until no new part arrived for `delay` seconds.
+
+    Telegram delivers an album as one update per item, all sharing a
+    media_group_id; the collected messages are handed to on_complete at once.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.groups = {}
+        # Completions in flight; the loop only keeps weak references to tasks
+        self.tasks = set()
+
+    def start(self, msg, on_complete):
+        """Open a group with msg as its first part (or join it if already open)."""
+        if self.join(msg):
+            return
+        self.groups[msg.media_group_id] = {'messages': [msg], 'on_complete': on_complete, 'timer': None}
+        self._arm(msg.media_group_id)
+
+    def join(self, msg):
+        """Add msg to its open group; False if nothing is collecting that group."""
+        group = self.groups.get(msg.media_group_id) if msg.media_group_id else None
+        if group is None:
+            return False
+        group['messages'].append(msg)
+        self._arm(msg.media_group_id)
+        return True
+
+    def _arm(self, group_id):
+        group = self.groups[group_id]
+        if group['timer'] is not None:
+            group['timer'].cancel()
+        loop = asyncio.get_running_loop()
+        group['timer'] = loop.call_later(self.delay, self._fire, group_id)
+
+    def _fire(self, group_id):
+        task = asyncio.create_task(self._complete(group_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _complete(self, group_id):
+        group = self.groups.pop(group_id, None)
+        if group is None:
+            return
+        try:
+            messages = sorted(group['messages'], key=lambda m: m.message_id)
+            await group['on_complete'](messages)
+        except Exception as e:
+            logger.error(f"❌ Failed to handle album {group_id}: {e}")
+
+
+albums = AlbumCollector(delay=float(os.getenv('ALBUM_DELAY', '1.0')))
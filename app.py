@@ -1,5 +1,9 @@
-from flask import Flask
+from flask import Flask, request
+from telegram import Update
+import asyncio
+import hmac
 import logging
+import os
 import time
 from threading import Thread
 
@@ -10,6 +14,12 @@ logger = logging.getLogger(__name__)
 # Keep-alive counter
 counter = 0
 
+# Webhook mode: bot.py attaches its running Application here
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+bot_app = None
+bot_loop = None
+
 def heartbeat():
     """Send logs every second to keep instance alive"""
     global counter
@@ -36,5 +46,33 @@ def ping():
     logger.info("🏓 Ping received")
     return "PONG", 200
 
+def attach_bot(application, loop):
+    """Route webhook POSTs into application's update queue on loop."""
+    global bot_app, bot_loop
+    bot_app = application
+    bot_loop = loop
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def webhook():
+    if bot_app is None:
+        return "Webhook mode is off", 503
+    
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        logger.warning("⛔️ Webhook call with a bad secret token")
+        return "Forbidden", 403
+    
+    payload = request.get_json(force=True, silent=True)
+    if not payload or not isinstance(payload, dict):
+        return "Bad Request", 400
+    
+    try:
+        update = Update.de_json(payload, bot_app.bot)
+    except Exception as e:
+        logger.warning(f"⚠️ Webhook body is not an update: {e}")
+        return "Bad Request", 400
+    asyncio.run_coroutine_threadsafe(bot_app.update_queue.put(update), bot_loop)
+    return "OK", 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
@@ -1,53 +1,18 @@
 import os
 import logging
 import asyncio
-from telegram import Update
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    ConversationHandler,
-    filters
-)
+import signal
+import threading
+from telegram.ext import Application
 
-from database import db
-from user_handlers import (
-    user_panel,
-    handle_user_message,
-    user_send_callback,
-    user_plans_callback,
-    plan_selected,
-    handle_payment_screenshot,
-    user_mybot_callback,
-    user_help_callback,
-    cancel_payment_callback
-)
-from owner_handlers import (
-    owner_panel,
-    owner_stats_callback,
-    owner_active_callback,
-    owner_banned_callback,
-    user_info_callback,
-    ban_user_callback,
-    unban_user_callback,
-    owner_ban_callback,
-    owner_unban_callback,
-    owner_broadcast_callback,
-    receive_broadcast,
-    owner_plans_callback,
-    create_plan_callback,
-    plan_days_handler,
-    plan_price_handler,
-    plan_upi_handler,
-    delete_plan_callback,
-    owner_payments_callback,
-    cancel_conversation,
-    BROADCAST_MSG,
-    PLAN_DAYS,
-    PLAN_PRICE,
-    PLAN_UPI
-)
+from concurrency import PerChatUpdateProcessor
+from clones import clone_manager
+from supervisor import ShardSupervisor
+from tokens import token_validator
+from database import Database
+from expiry import CloneExpiryScheduler
+from handlers import setup_bot, post_init, post_shutdown
+from persistence import database_persistence
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -58,223 +23,14 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 OWNER_ID = int(os.getenv('OWNER_ID'))
 OWNER_NAME = os.getenv('OWNER_NAME', 'Sam')
+# Updates handled in parallel (updates of one chat always run one after another)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '64'))
+# Worker processes for clone bots (0 = run clones inside this process)
+CLONE_SHARDS = int(os.getenv('CLONE_SHARDS', '0'))
 
-async def start(update: Update, context):
-    user_id = update.effective_user.id
-    
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
-    
-    if user_id == OWNER_ID:
-        await owner_panel(update, context)
-    else:
-        await user_panel(update, context)
-
-async def plans_command(update: Update, context):
-    """Handle /plans command"""
-    plans = db.get_plans()
-    
-    if not plans:
-        await update.message.reply_text("📋 No subscription plans available yet.")
-        return
-    
-    text = "🤖 Clone Bot Subscription Plans\n━━━━━━━━━━━━━━━━\n\nChoose a plan:\n"
-    
-    keyboard = []
-    for plan in plans:
-        button_text = f"{plan['days']} Day{'s' if plan['days'] > 1 else ''} - ₹{plan['price']}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"plan_{plan['id']}")])
-    
-    from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-
-async def handle_text_message(update: Update, context):
-    user_id = update.effective_user.id
-    msg = update.message
-    
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
-    
-    # Owner actions
-    if user_id == OWNER_ID:
-        # Check for ban action
-        if 'awaiting_ban' in context.user_data and context.user_data['awaiting_ban']:
-            try:
-                ban_id = int(msg.text)
-                db.ban_user(ban_id)
-                await msg.reply_text(f"✅ User {ban_id} has been banned!")
-                context.user_data['awaiting_ban'] = False
-                logger.info(f"🚫 User {ban_id} banned")
-                return
-            except:
-                await msg.reply_text("❌ Invalid ID. Send numbers only:")
-                return
-        
-        # Check for unban action
-        if 'awaiting_unban' in context.user_data and context.user_data['awaiting_unban']:
-            try:
-                unban_id = int(msg.text)
-                db.unban_user(unban_id)
-                await msg.reply_text(f"✅ User {unban_id} has been unbanned!")
-                context.user_data['awaiting_unban'] = False
-                logger.info(f"✅ User {unban_id} unbanned")
-                return
-            except:
-                await msg.reply_text("❌ Invalid ID. Send numbers only:")
-                return
-        
-        # Check for delete plan action
-        if 'awaiting_delete_plan' in context.user_data and context.user_data['awaiting_delete_plan']:
-            try:
-                plan_id = int(msg.text)
-                db.delete_plan(plan_id)
-                await msg.reply_text(f"✅ Plan #{plan_id} deleted!")
-                context.user_data['awaiting_delete_plan'] = False
-                logger.info(f"🗑 Plan {plan_id} deleted")
-                return
-            except:
-                await msg.reply_text("❌ Invalid plan ID:")
-                return
-        
-        # Check if replying to user message
-        if msg.reply_to_message:
-            target_user = db.get_user_from_msg(msg.reply_to_message.message_id)
-            if target_user:
-                try:
-                    await context.bot.send_message(target_user, msg.text)
-                    await msg.reply_text(f"✅ Reply sent to user {target_user}!")
-                    logger.info(f"�� Reply sent to user {target_user}")
-                    return
-                except Exception as e:
-                    await msg.reply_text(f"❌ Failed to send: {e}")
-                    return
-    
-    # Regular user sending message
-    await handle_user_message(update, context)
-
-async def handle_media_message(update: Update, context):
-    user_id = update.effective_user.id
-    msg = update.message
-    
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
-    
-    # Check if owner replying
-    if user_id == OWNER_ID and msg.reply_to_message:
-        target_user = db.get_user_from_msg(msg.reply_to_message.message_id)
-        if target_user:
-            try:
-                if msg.photo:
-                    await context.bot.send_photo(target_user, msg.photo[-1].file_id, caption=msg.caption or "")
-                elif msg.video:
-                    await context.bot.send_video(target_user, msg.video.file_id, caption=msg.caption or "")
-                elif msg.document:
-                    await context.bot.send_document(target_user, msg.document.file_id, caption=msg.caption or "")
-                elif msg.voice:
-                    await context.bot.send_voice(target_user, msg.voice.file_id)
-                elif msg.audio:
-                    await context.bot.send_audio(target_user, msg.audio.file_id, caption=msg.caption or "")
-                
-                await msg.reply_text(f"✅ Media sent to user {target_user}!")
-                logger.info(f"📎 Media sent to user {target_user}")
-                return
-            except Exception as e:
-                await msg.reply_text(f"❌ Failed: {e}")
-                return
-    
-    # Check if user sending payment screenshot
-    if msg.photo and 'selected_plan' in context.user_data:
-        await handle_payment_screenshot(update, context)
-        return
-    
-    # Regular user media
-    await handle_user_message(update, context)
-
-async def handle_callback(update: Update, context):
-    query = update.callback_query
-    data = query.data
-    user_id = query.from_user.id
-    
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
-    
-    # User callbacks
-    if data == "user_send":
-        await user_send_callback(update, context)
-    elif data == "user_plans":
-        await user_plans_callback(update, context)
-    elif data.startswith("plan_"):
-        await plan_selected(update, context)
-    elif data == "user_mybot":
-        await user_mybot_callback(update, context)
-    elif data == "user_help":
-        await user_help_callback(update, context)
-    elif data == "cancel_payment":
-        await cancel_payment_callback(update, context)
-    
-    # Owner callbacks
-    elif data == "owner_stats":
-        await owner_stats_callback(update, context)
-    elif data == "owner_active":
-        await owner_active_callback(update, context)
-    elif data == "owner_banned":
-        await owner_banned_callback(update, context)
-    elif data.startswith("userinfo_"):
-        await user_info_callback(update, context)
-    elif data.startswith("ban_"):
-        await ban_user_callback(update, context)
-    elif data.startswith("unban_"):
-        await unban_user_callback(update, context)
-    elif data == "owner_ban":
-        await owner_ban_callback(update, context)
-    elif data == "owner_unban":
-        await owner_unban_callback(update, context)
-    elif data == "owner_broadcast":
-        await owner_broadcast_callback(update, context)
-    elif data == "owner_plans":
-        await owner_plans_callback(update, context)
-    elif data == "create_plan":
-        await create_plan_callback(update, context)
-    elif data == "delete_plan":
-        await delete_plan_callback(update, context)
-    elif data == "owner_payments":
-        await owner_payments_callback(update, context)
-    
-    # Payment approval/rejection
-    elif data.startswith("approve_"):
-        payment_id = int(data.split("_")[1])
-        payment = db.approve_payment(payment_id)
-        
-        if payment:
-            await query.answer("✅ Approved!", show_alert=True)
-            await query.message.edit_caption(
-                caption=query.message.caption + "\n\n✅ APPROVED - Waiting for bot token"
-            )
-            
-            # Notify user
-            user_id = payment['user_id']
-            await context.bot.send_message(
-                user_id,
-                f"🎉 Payment Approved!\n\n"
-                f"Now send your bot token from @BotFather\n\n"
-                f"Steps:\n"
-                f"1. Go to @BotFather\n"
-                f"2. Create new bot with /newbot\n"
-                f"3. Copy the bot token\n"
-                f"4. Send it here"
-            )
-            
-            context.user_data[f'awaiting_token_{user_id}'] = payment
-            logger.info(f"✅ Payment {payment_id} approved")
-    
-    elif data.startswith("reject_"):
-        payment_id = int(data.split("_")[1])
-        if db.reject_payment(payment_id):
-            await query.answer("❌ Rejected!", show_alert=True)
-            await query.message.edit_caption(
-                caption=query.message.caption + "\n\n❌ REJECTED"
-            )
-            logger.info(f"❌ Payment {payment_id} rejected")
+# Webhook mode: set WEBHOOK_URL (public https base URL) to receive updates on PORT instead of polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+PORT = int(os.getenv('PORT', '8080'))
 
 async def keep_alive_logger():
     """Send logs every second to keep instance alive"""
@@ -284,54 +40,107 @@ async def keep_alive_logger():
         logger.info(f"🟢 Keep-Alive #{counter} - Bot monitoring active")
         await asyncio.sleep(1)
 
-def main():
-    if not BOT_TOKEN or not OWNER_ID:
-        logger.error("❌ Missing BOT_TOKEN or OWNER_ID!")
+async def on_startup(app: Application):
+    await post_init(app)
+    
+    # Start coalesced background flushing of the database
+    db = app.bot_data['db']
+    db.start()
+    # Deactivate clones whose token was revoked, before any of them is started
+    await token_validator.revalidate(db, app.bot)
+    # Deactivate clone bots as they expire (one job for the next expiry)
+    clone_expiry = app.bot_data['clone_expiry']
+    clone_expiry.start(app.job_queue)
+    # Run every active clone bot, stopping each as it expires
+    clones = app.bot_data['clones']
+    clone_expiry.add_listener(clones.stop_many)
+    await clones.start_all()
+
+async def on_shutdown(app: Application):
+    await post_shutdown(app)
+    await app.bot_data['clones'].stop_all()
+    await token_validator.close()
+    # Final flush so nothing marked dirty is lost on exit
+    app.bot_data['db'].close()
+    logger.info("💾 Database flushed")
+
+async def run_webhook(app: Application):
+    """Serve app.py (health checks + webhook) on PORT and feed updates to app."""
+    # Imported here: app.py starts its heartbeat thread on import
+    from werkzeug.serving import make_server
+    import app as web
+    
+    if not web.WEBHOOK_SECRET:
+        logger.error("❌ WEBHOOK_SECRET is required in webhook mode!")
         return
     
-    app = Application.builder().token(BOT_TOKEN).build()
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    
+    web.attach_bot(app, asyncio.get_running_loop())
+    server = make_server('0.0.0.0', PORT, web.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
     
-    # Broadcast conversation
-    broadcast_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(owner_broadcast_callback, pattern="^owner_broadcast$")],
-        states={
-            BROADCAST_MSG: [MessageHandler(filters.ALL & ~filters.COMMAND, receive_broadcast)]
-        },
-        fallbacks=[CommandHandler("cancel", cancel_conversation)]
+    await app.bot.set_webhook(
+        WEBHOOK_URL + web.WEBHOOK_PATH,
+        secret_token=web.WEBHOOK_SECRET,
+        allowed_updates=app.bot_data['update_gate'].allowed
     )
+    logger.info(f"🌐 Webhook mode on port {PORT}: {WEBHOOK_URL}{web.WEBHOOK_PATH}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    
+    server.shutdown()
+    await app.stop()
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+def main():
+    if not BOT_TOKEN or not OWNER_ID:
+        logger.error("❌ Missing BOT_TOKEN or OWNER_ID!")
+        return
     
-    # Create plan conversation
-    plan_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(create_plan_callback, pattern="^create_plan$")],
-        states={
-            PLAN_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_days_handler)],
-            PLAN_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_price_handler)],
-            PLAN_UPI: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_upi_handler)]
-        },
-        fallbacks=[CommandHandler("cancel", cancel_conversation)]
+    # Built here, not at import: clone shard workers re-import this module
+    db = Database()
+    
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .concurrent_updates(PerChatUpdateProcessor(UPDATE_CONCURRENCY))
+        .persistence(database_persistence(db))
+        .build()
     )
     
-    # Add handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("plans", plans_command))
-    app.add_handler(broadcast_conv)
-    app.add_handler(plan_conv)
-    app.add_handler(CallbackQueryHandler(handle_callback))
-    app.add_handler(MessageHandler(
-        filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.VOICE | filters.AUDIO | filters.VIDEO_NOTE,
-        handle_media_message
-    ))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    setup_bot(app, OWNER_ID, OWNER_NAME, db)
+    app.bot_data['clone_expiry'] = CloneExpiryScheduler(db, reminder_days=int(os.getenv('CLONE_REMINDER_DAYS', '1')))
+    if CLONE_SHARDS:
+        app.bot_data['clones'] = ShardSupervisor(db, CLONE_SHARDS)
+    else:
+        app.bot_data['clones'] = clone_manager(db, setup_bot, post_init=post_init, post_shutdown=post_shutdown)
+    update_gate = app.bot_data['update_gate']
     
     logger.info("🚀 Bot starting...")
     logger.info(f"👑 Owner ID: {OWNER_ID}")
     logger.info(f"📝 Owner Name: {OWNER_NAME}")
+    logger.info(f"📥 Update types: {', '.join(update_gate.allowed)}")
     
     # Start keep-alive in background
     loop = asyncio.get_event_loop()
     loop.create_task(keep_alive_logger())
     
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        loop.run_until_complete(run_webhook(app))
+    else:
+        app.run_polling(allowed_updates=update_gate.allowed)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from albums import build_media
+from delivery import DELIVERED, TRANSIENT, UNREACHABLE, classify_error
+from outbox import BROADCAST, OWNER, outbox_for
+from ratelimit import KeyedLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Broadcast share of the bot's send budget (the outbox caps the total) and ~1/s per chat
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+MAX_ATTEMPTS = 3
+
+
+class BroadcastEngine:
+    """Fans one message out to many chats as fast as the Bot API allows.
+
+    A fixed pool of workers drains a queue of chat ids. Every send takes a
+    token from the broadcast bucket and from the chat's own bucket, and
+    transient errors are retried a couple of times. Sends should go through
+    the bot's Outbox at BROADCAST priority, which applies the global limit
+    and RetryAfter backoff shared with everything else the bot sends.
+    """
+
+    def __init__(self, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY):
+        self.limiter = TokenBucket(rate)
+        self.per_chat = KeyedLimiter(1, burst=1)
+        self.concurrency = concurrency
+
+    async def run(self, chat_ids, send, progress=None, progress_every=5, on_result=None, should_stop=None):
+        """Await send(chat_id) for every chat; returns (success, failed).
+
+        on_result(chat_id, outcome) is called once per chat with DELIVERED or
+        the classify_error() outcome of the last attempt; once should_stop()
+        returns true, workers finish their current send and stop.
+        """
+        queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait((chat_id, 1))
+
+        counts = {'success': 0, 'failed': 0}
+
+        def record(chat_id, outcome):
+            counts['success' if outcome == DELIVERED else 'failed'] += 1
+            if on_result:
+                on_result(chat_id, outcome)
+
+        async def worker():
+            while True:
+                if should_stop and should_stop():
+                    return
+                try:
+                    chat_id, attempt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.limiter.take()
+                await self.per_chat.take(chat_id)
+                try:
+                    await send(chat_id)
+                    record(chat_id, DELIVERED)
+                except Exception as e:
+                    outcome = classify_error(e)
+                    if outcome == TRANSIENT and attempt < MAX_ATTEMPTS:
+                        queue.put_nowait((chat_id, attempt + 1))
+                    else:
+                        logger.debug(f"Broadcast to {chat_id} failed ({outcome}): {e}")
+                        record(chat_id, outcome)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_every)
+                try:
+                    await progress(counts['success'], counts['failed'])
+                except Exception as e:
+                    logger.debug(f"Broadcast progress update failed: {e}")
+
+        started = time.monotonic()
+        report = asyncio.create_task(reporter()) if progress else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            if report:
+                report.cancel()
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"📢 Broadcast finished in {elapsed:.1f}s "
+            f"({(counts['success'] + counts['failed']) / max(elapsed, 0.001):.1f} msg/s)"
+        )
+        return counts['success'], counts['failed']
+
+
+class BroadcastManager:
+    """Runs broadcasts as durable jobs that survive restarts.
+
+    The job record keeps the message reference (or the album's media), a cursor below which every
+    target is settled, and the sent/failed ids at or past the cursor (the
+    only ones that can be out of order). It is checkpointed every
+    checkpoint_every results or checkpoint_interval seconds, so a restart
+    re-sends at most what was in flight. Chats found unreachable are pruned
+    from the audience in bulk at each checkpoint.
+    """
+
+    def __init__(self, db, engine, checkpoint_every=200, checkpoint_interval=10):
+        self.db = db
+        self.engine = engine
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.tasks = {}
+
+    def create(self, from_chat_id, message_id, targets, status_chat, status_msg, media=None):
+        return self.db.create_broadcast(from_chat_id, message_id, targets, status_chat, status_msg, media)
+
+    def start(self, bot, job):
+        running = self.tasks.get(job['id'])
+        if running is not None and not running.done():
+            return
+        job['state'] = 'running'
+        self.db.save_broadcast(job)
+        task = asyncio.create_task(self._run(bot, job))
+        self.tasks[job['id']] = task
+        task.add_done_callback(lambda t: self._forget(job['id'], t))
+
+    def _forget(self, job_id, task):
+        # A resumed job may already have its next task registered
+        if self.tasks.get(job_id) is task:
+            del self.tasks[job_id]
+
+    def resume_all(self, bot):
+        """Restart jobs that were running when the process went down."""
+        jobs = [j for j in self.db.get_unfinished_broadcasts() if j['state'] == 'running']
+        for job in jobs:
+            logger.info(f"🔁 Resuming broadcast #{job['id']} at {job['cursor']}/{job['total']}")
+            self.start(bot, job)
+        return len(jobs)
+
+    def checkpoint_all(self):
+        """Persist in-flight progress, e.g. right before shutdown."""
+        for job in self.db.get_unfinished_broadcasts():
+            self.db.save_broadcast(job)
+
+    def pause(self, job_id):
+        job = self.db.get_broadcast(job_id)
+        if job and job['state'] == 'running':
+            job['state'] = 'paused'
+            self.db.save_broadcast(job)
+        return job
+
+    async def resume(self, bot, job_id):
+        job = self.db.get_broadcast(job_id)
+        if job and job['state'] == 'paused':
+            draining = self.tasks.get(job['id'])
+            if draining is not None:
+                # Paused moments ago: the old run is still settling its in-flight sends
+                await asyncio.wait({draining})
+            if job['state'] == 'paused':
+                self.start(bot, job)
+        return job
+
+    async def cancel(self, bot, job_id):
+        job = self.db.get_broadcast(job_id)
+        if job and job['state'] in ('running', 'paused'):
+            was_running = job['id'] in self.tasks
+            job['state'] = 'cancelled'
+            self.db.save_broadcast(job)
+            if not was_running:
+                await self._report(bot, job)
+        return job
+
+    @staticmethod
+    def render(job):
+        settled = job['sent_count'] + job['failed_count']
+        title = {
+            'running': f"📤 Broadcast #{job['id']} in progress...",
+            'paused': f"⏸ Broadcast #{job['id']} paused",
+            'cancelled': f"✖️ Broadcast #{job['id']} cancelled",
+            'done': "✅ Broadcast Complete!"
+        }[job['state']]
+        text = (
+            f"{title}\n\n"
+            f"📊 Results:\n"
+            f"✅ Sent: {job['sent_count']}\n"
+            f"❌ Failed: {job['failed_count']}\n"
+            f"🧹 Unreachable (pruned): {job.get('unreachable_count', 0)}\n"
+            f"📈 Total: {job['total']}"
+        )
+        if job['state'] in ('running', 'paused'):
+            text += f"\n⏳ Remaining: {job['total'] - settled}"
+
+        buttons = []
+        if job['state'] == 'running':
+            buttons.append(InlineKeyboardButton("⏸ Pause", callback_data=f"bcast_pause_{job['id']}"))
+        elif job['state'] == 'paused':
+            buttons.append(InlineKeyboardButton("▶️ Resume", callback_data=f"bcast_resume_{job['id']}"))
+        if job['state'] in ('running', 'paused'):
+            buttons.append(InlineKeyboardButton("✖️ Cancel", callback_data=f"bcast_cancel_{job['id']}"))
+        return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    async def _report(self, bot, job):
+        text, markup = self.render(job)
+        try:
+            await outbox_for(bot).call(
+                OWNER, bot.edit_message_text, text, job['status_chat'], job['status_msg'], reply_markup=markup
+            )
+        except BadRequest as e:
+            # "Message is not modified" and friends
+            logger.debug(f"Broadcast status update skipped: {e}")
+
+    async def _run(self, bot, job):
+        targets = self.db.get_broadcast_targets(job['id'])
+        settled = bytearray(len(targets))
+        done = set(job['sent']) | set(job['failed'])
+        position = {}
+        remaining = []
+        for i in range(job['cursor'], len(targets)):
+            if targets[i] in done:
+                settled[i] = 1
+            else:
+                position[targets[i]] = i
+                remaining.append(targets[i])
+
+        pending = {'results': 0, 'at': time.monotonic()}
+        unreachable = []
+
+        def checkpoint():
+            cursor = job['cursor']
+            while cursor < len(targets) and settled[cursor]:
+                cursor += 1
+            if cursor > job['cursor']:
+                behind = set(targets[job['cursor']:cursor])
+                job['sent'] = [u for u in job['sent'] if u not in behind]
+                job['failed'] = [u for u in job['failed'] if u not in behind]
+                job['cursor'] = cursor
+            if unreachable:
+                self.db.mark_unreachable(unreachable)
+                unreachable.clear()
+            self.db.save_broadcast(job)
+            pending['results'] = 0
+            pending['at'] = time.monotonic()
+
+        def on_result(chat_id, outcome):
+            ok = outcome == DELIVERED
+            if outcome == UNREACHABLE:
+                unreachable.append(chat_id)
+                job['unreachable_count'] = job.get('unreachable_count', 0) + 1
+            job['sent' if ok else 'failed'].append(chat_id)
+            job['sent_count' if ok else 'failed_count'] += 1
+            settled[position[chat_id]] = 1
+            pending['results'] += 1
+            if (pending['results'] >= self.checkpoint_every
+                    or time.monotonic() - pending['at'] >= self.checkpoint_interval):
+                checkpoint()
+
+        outbox = outbox_for(bot)
+
+        async def send(chat_id):
+            if job.get('media'):
+                await outbox.call(BROADCAST, bot.send_media_group, chat_id, build_media(job['media']))
+            else:
+                await outbox.call(BROADCAST, bot.copy_message, chat_id, job['from_chat_id'], job['message_id'])
+
+        async def progress(success, failed):
+            await self._report(bot, job)
+
+        try:
+            await self.engine.run(
+                remaining, send, progress,
+                on_result=on_result,
+                should_stop=lambda: job['state'] != 'running'
+            )
+            if job['state'] == 'running':
+                job['state'] = 'done'
+        finally:
+            checkpoint()
+
+        await self._report(bot, job)
+        logger.info(
+            f"📢 Broadcast #{job['id']} {job['state']}: "
+            f"{job['sent_count']} success, {job['failed_count']} failed"
+        )
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+import time
+
+from telegram import Bot, Update
+from telegram.error import InvalidToken
+from telegram.ext import Application, TypeHandler
+from telegram.request import HTTPXRequest
+
+from concurrency import PerChatUpdateProcessor
+from flood import release_flood_guard
+from outbox import outbox_for, release_outbox
+from persistence import database_persistence
+from tenants import tenants
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRequest(HTTPXRequest):
+    """An HTTPXRequest whose connection pool outlives the bots using it.
+
+    Every clone's Bot calls shutdown() when it stops; that must not close the
+    client the other clones are still sending through. close() really does.
+    """
+
+    async def shutdown(self):
+        pass
+
+    async def close(self):
+        await super().shutdown()
+
+
+class CloneManager:
+    """Runs every active clone bot inside this process.
+
+    A clone is a full Application with the same handlers as the main bot
+    (set up by `setup` with the buyer as owner and its tenant Database),
+    polling on the shared event loop. All clones send through one shared
+    connection pool and long-poll through another, so a clone costs a few
+    objects and tasks instead of a process and its own sockets.
+
+    A clone without updates for idle_timeout seconds hibernates: its
+    Application and Database are shut down and only a bare Bot is kept. One
+    shared task checks the sleeping clones in rotation (wake_rate checks per
+    second) with an unconfirmed getUpdates(limit=1, timeout=0), and starts the
+    full clone again as soon as one has something pending, which it then
+    receives as usual.
+    """
+
+    def __init__(self, db, setup, post_init=None, post_shutdown=None, tenants=tenants,
+                 pool_size=64, poll_pool_size=256, concurrency=8, idle_timeout=0, wake_rate=20):
+        self.db = db
+        self.setup = setup
+        self.post_init = post_init
+        self.post_shutdown = post_shutdown
+        self.tenants = tenants
+        self.concurrency = concurrency
+        self.request = SharedRequest(connection_pool_size=pool_size)
+        # One long poll per clone is always open, so this pool bounds the clone count
+        self.poll_request = SharedRequest(connection_pool_size=poll_pool_size)
+        self.idle_timeout = idle_timeout
+        self.wake_rate = wake_rate
+        # buyer user id -> running Application
+        self.apps = {}
+        # buyer user id -> (Bot, owner name, username) of a hibernated clone
+        self.sleeping = {}
+        self.last_active = {}
+        self.locks = {}
+        self.failed = {}
+        self.tasks = []
+        self.wakeups = 0
+
+    def username(self, user_id):
+        """@username of the running (or hibernated) clone of user_id, or None."""
+        app = self.apps.get(user_id)
+        if app:
+            return app.bot.username
+        sleeping = self.sleeping.get(user_id)
+        return sleeping[2] if sleeping else None
+
+    def _lock(self, user_id):
+        lock = self.locks.get(user_id)
+        if lock is None:
+            lock = self.locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def start_all(self):
+        """Start every active clone, a few at a time."""
+        gate = asyncio.Semaphore(10)
+
+        async def start_one(uid, clone):
+            owner = self.db.get_user(int(uid))
+            async with gate:
+                try:
+                    await self.start(int(uid), clone['bot_token'], owner['name'] if owner else 'Owner')
+                except Exception as e:
+                    self.failed[int(uid)] = str(e)
+                    logger.error(f"❌ Clone of user {uid} failed to start: {e}")
+
+        clones = self.db.get_active_clones()
+        await asyncio.gather(*(start_one(uid, clone) for uid, clone in clones.items()))
+        logger.info(f"🤖 {len(self.apps)}/{len(clones)} clone bots running")
+
+    async def start(self, user_id, token, owner_name):
+        """Start (or restart with a new token) the clone of user_id; returns its @username.
+
+        Raises whatever getMe raises for a bad token, leaving a running clone
+        with the old token untouched.
+        """
+        self._start_tasks()
+        async with self._lock(user_id):
+            running = self.apps.get(user_id)
+            if running is not None and running.bot.token == token:
+                return running.bot.username
+
+            app = await self._launch(user_id, token, owner_name)
+            if running is not None:
+                await self._shutdown(running)
+            self.sleeping.pop(user_id, None)
+            self.apps[user_id] = app
+            self.last_active[user_id] = time.monotonic()
+            self.failed.pop(user_id, None)
+            return app.bot.username
+
+    async def _launch(self, user_id, token, owner_name):
+        # Data is kept per bot, so a buyer who switches tokens starts a fresh audience
+        bot_id = int(token.split(':')[0])
+        database = self.tenants.acquire(bot_id)
+        app = (
+            Application.builder()
+            .token(token)
+            .request(self.request)
+            .get_updates_request(self.poll_request)
+            .concurrent_updates(PerChatUpdateProcessor(self.concurrency))
+            .persistence(database_persistence(database))
+            .build()
+        )
+        self.setup(app, user_id, owner_name, database, is_clone=True)
+        app.bot_data['TENANT'] = bot_id
+        app.add_handler(TypeHandler(Update, self._touch(user_id)), group=-3)
+
+        try:
+            # Calls getMe: an invalid or revoked token fails here
+            await app.initialize()
+        except Exception:
+            self.tenants.release(bot_id)
+            raise
+
+        try:
+            if self.post_init:
+                await self.post_init(app)
+            await app.updater.start_polling(allowed_updates=app.bot_data['update_gate'].allowed)
+            await app.start()
+        except Exception:
+            await self._shutdown(app)
+            raise
+        logger.info(f"🤖 Clone @{app.bot.username} of user {user_id} is running")
+        return app
+
+    async def _shutdown(self, app):
+        try:
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+            await app.shutdown()
+            if self.post_shutdown:
+                await self.post_shutdown(app)
+        finally:
+            self.tenants.release(app.bot_data['TENANT'])
+            await release_outbox(app.bot)
+            release_flood_guard(app.bot)
+
+    def _touch(self, user_id):
+        async def touch(update, context):
+            self.last_active[user_id] = time.monotonic()
+        return touch
+
+    def _start_tasks(self):
+        if not self.tasks and self.idle_timeout > 0:
+            self.tasks = [asyncio.create_task(self._hibernate_idle()), asyncio.create_task(self._check_sleepers())]
+
+    @staticmethod
+    def _busy(app):
+        return bool(app.bot_data['broadcasts'].tasks) or outbox_for(app.bot).stats()['depth'] > 0
+
+    async def _hibernate_idle(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for user_id in [uid for uid in self.apps if self.last_active.get(uid, 0) < cutoff]:
+                try:
+                    await self._hibernate(user_id)
+                except Exception as e:
+                    logger.error(f"❌ Could not hibernate clone of user {user_id}: {e}")
+
+    async def _hibernate(self, user_id):
+        async with self._lock(user_id):
+            app = self.apps.get(user_id)
+            if app is None or self._busy(app):
+                return
+            del self.apps[user_id]
+            # A bare Bot is enough to ask Telegram whether anything is pending
+            bot = Bot(app.bot.token, request=self.request, get_updates_request=self.request)
+            self.sleeping[user_id] = (bot, app.bot_data['OWNER_NAME'], app.bot.username)
+            await self._shutdown(app)
+            logger.info(f"💤 Clone @{app.bot.username} of user {user_id} hibernated")
+
+    async def _check_sleepers(self):
+        while True:
+            if not self.sleeping:
+                await asyncio.sleep(1)
+                continue
+            for user_id in list(self.sleeping):
+                sleeping = self.sleeping.get(user_id)
+                if sleeping is None:
+                    continue
+                bot, owner_name, username = sleeping
+                try:
+                    # No offset: pending updates stay unconfirmed for the woken clone
+                    pending = await bot.get_updates(limit=1, timeout=0)
+                except InvalidToken as e:
+                    # Revoked while asleep: stop checking instead of failing every round
+                    self.sleeping.pop(user_id, None)
+                    self.failed[user_id] = str(e)
+                    logger.error(f"❌ Token of sleeping clone @{username} was revoked")
+                    continue
+                except Exception as e:
+                    logger.warning(f"⚠️ Wake check of clone @{username} failed: {e}")
+                    pending = None
+                if pending:
+                    self.wakeups += 1
+                    logger.info(f"⏰ Waking clone @{username} of user {user_id}")
+                    try:
+                        await self.start(user_id, bot.token, owner_name)
+                    except Exception as e:
+                        self.failed[user_id] = str(e)
+                        logger.error(f"❌ Clone of user {user_id} failed to wake: {e}")
+                await asyncio.sleep(1 / self.wake_rate)
+
+    async def stop(self, user_id):
+        async with self._lock(user_id):
+            self.sleeping.pop(user_id, None)
+            self.last_active.pop(user_id, None)
+            app = self.apps.pop(user_id, None)
+            if app is not None:
+                await self._shutdown(app)
+                logger.info(f"🛑 Clone @{app.bot.username} of user {user_id} stopped")
+
+    async def stop_many(self, user_ids):
+        """Expiry listener: stop the clones that just expired."""
+        await asyncio.gather(*(self.stop(uid) for uid in user_ids))
+
+    async def stop_all(self):
+        for task in self.tasks:
+            task.cancel()
+        await self.stop_many(list(self.apps) + list(self.sleeping))
+        self.tenants.close_all()
+        await self.request.close()
+        await self.poll_request.close()
+
+    def stats(self):
+        return {
+            'running': len(self.apps),
+            'sleeping': len(self.sleeping),
+            'failed': len(self.failed),
+            'wakeups': self.wakeups
+        }
+
+
+def clone_manager(db, setup, post_init=None, post_shutdown=None):
+    """A CloneManager configured from the environment."""
+    return CloneManager(
+        db,
+        setup,
+        post_init=post_init,
+        post_shutdown=post_shutdown,
+        pool_size=int(os.getenv('CLONE_POOL_SIZE', '64')),
+        poll_pool_size=int(os.getenv('CLONE_POLL_POOL_SIZE', '256')),
+        concurrency=int(os.getenv('CLONE_UPDATE_CONCURRENCY', '8')),
+        idle_timeout=float(os.getenv('CLONE_IDLE_MINUTES', '30')) * 60,
+        wake_rate=float(os.getenv('CLONE_WAKE_RATE', '20'))
+    )
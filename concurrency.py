@@ -0,0 +1,61 @@
+import asyncio
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each chat's updates in order.
+
+    Updates from the same chat (or user, for updates without a chat) wait
+    on that chat's lock before taking one of the max_concurrent_updates
+    slots, so a busy chat queues behind itself instead of blocking other
+    chats, and flags in user_data and conversation states never see two
+    updates of one user interleaved.
+
+    PTB takes its own semaphore before do_process_update, where a chat
+    waiting on its lock would hold a slot; that one is left unbounded and
+    the real limit is enforced here, after the lock.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self.slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # key -> [lock, number of updates holding or waiting for it]
+        self.locks = {}
+
+    @staticmethod
+    def _key(update):
+        if getattr(update, 'effective_chat', None):
+            return update.effective_chat.id
+        if getattr(update, 'effective_user', None):
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self.slots:
+                await coroutine
+            return
+
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self.slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -1,17 +1,20 @@
-import json
 import os
 from datetime import datetime, timedelta
 
+from routing import RouteSpill, RouteStore
+from storage import open_storage
+
 class Database:
-    def __init__(self):
-        self.file = 'data.json'
+    def __init__(self, file=None, backend=None):
+        self.file = file or os.getenv('DB_FILE', 'data.json')
+        # Called with the buyer's id whenever a clone is added or renewed
+        self.on_clone_added = None
+        self.store = open_storage(backend or os.getenv('DB_BACKEND', 'json'), self.file)
         self.load()
     
     def load(self):
-        if os.path.exists(self.file):
-            with open(self.file, 'r') as f:
-                self.data = json.load(f)
-        else:
+        self.data = self.store.load()
+        if self.data is None:
             self.data = {
                 'users': {},
                 'banned': [],
@@ -32,10 +35,74 @@ class Database:
                 ]
             }
             self.save()
+        self._build_indexes()
+        self._open_routes()
+    
+    def _build_indexes(self):
+        # Secondary indexes over self.data, kept in step by every mutator
+        self._banned = set(self.data['banned'])
+        self._active = {
+            k: v for k, v in self.data['users'].items()
+            if v.get('is_active', True) and v.get('reachable', True) and v['id'] not in self._banned
+        }
+        self._plans = {p['id']: p for p in self.data['plans']}
+        self._payments = {p['id']: p for p in self.data['pending_payments']}
+        self._pending = {p['id']: p for p in self.data['pending_payments'] if p['status'] == 'pending'}
+        # Bot id (the part of a token before ':') -> buyer, for active clones
+        self._clone_bots = {
+            c['bot_token'].split(':')[0]: int(uid)
+            for uid, c in self.data['cloned_bots'].items() if c.get('active', False)
+        }
+        
+        # Counters for the Statistics panel that no index size answers directly
+        self.data.setdefault('meta', {})
+        self._counts = {
+            'banned_users': sum(1 for uid in self._banned if str(uid) in self.data['users']),
+            'unreachable_users': sum(1 for v in self.data['users'].values() if v.get('reachable', True) is False),
+            'active_clones': sum(1 for c in self.data['cloned_bots'].values() if c.get('active', False)),
+            'messages_relayed': self.data['meta'].get('messages_relayed', 0)
+        }
+    
+    def _open_routes(self):
+        # Reply routes are bounded in memory; older ones optionally spill to disk
+        spill = None
+        if os.getenv('ROUTING_SPILL', 'false').lower() in ('1', 'true', 'yes'):
+            spill = RouteSpill(
+                os.path.splitext(self.file)[0] + '.routes.db',
+                max_age=float(os.getenv('ROUTING_SPILL_DAYS', '90')) * 86400
+            )
+        ttl_days = float(os.getenv('ROUTING_TTL_DAYS', '7'))
+        self.routes = RouteStore(
+            self.data.setdefault('message_map', {}),
+            max_size=int(os.getenv('ROUTING_MAX', '50000')),
+            ttl=ttl_days * 86400 if ttl_days > 0 else None,
+            spill=spill,
+            on_evict=lambda key: self._delete('message_map', key),
+            on_store=lambda key, route: self._put('message_map', key, route)
+        )
+        if self.routes.upgraded:
+            # Record the age of routes saved without one, once
+            self.save()
     
     def save(self):
-        with open(self.file, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        self.store.save(self.data)
+    
+    def _put(self, table, key, value):
+        self.store.put(table, key, value)
+    
+    def _delete(self, table, key):
+        self.store.delete(table, key)
+    
+    def start(self):
+        """Attach background flushing to the running event loop."""
+        self.store.start()
+    
+    def flush(self):
+        self.store.flush()
+    
+    def close(self):
+        self.store.close()
+        self.routes.close()
     
     def add_user(self, uid, username, fname):
         s = str(uid)
@@ -45,9 +112,35 @@ class Database:
                 'username': username,
                 'name': fname,
                 'joined': datetime.now().isoformat(),
-                'is_active': True
+                'is_active': not self.is_banned(uid)
             }
-            self.save()
+            if self.data['users'][s]['is_active']:
+                self._active[s] = self.data['users'][s]
+            else:
+                self._counts['banned_users'] += 1
+            self._put('users', s, self.data['users'][s])
+        elif self.data['users'][s].get('reachable', True) is False:
+            # They talked to us again, so deliveries work again
+            user = self.data['users'][s]
+            user['reachable'] = True
+            self._counts['unreachable_users'] -= 1
+            if user.get('is_active', True) and not self.is_banned(uid):
+                self._active[s] = user
+            self._put('users', s, user)
+    
+    def mark_unreachable(self, user_ids):
+        """Bulk-flag users that blocked the bot or deleted their account."""
+        marked = 0
+        for uid in user_ids:
+            s = str(uid)
+            user = self.data['users'].get(s)
+            if user and user.get('reachable', True):
+                user['reachable'] = False
+                self._counts['unreachable_users'] += 1
+                self._active.pop(s, None)
+                self._put('users', s, user)
+                marked += 1
+        return marked
     
     def get_user(self, uid):
         return self.data['users'].get(str(uid))
@@ -56,49 +149,66 @@ class Database:
         return self.data['users']
     
     def get_active_users(self):
-        return {k: v for k, v in self.data['users'].items() if v.get('is_active', True)}
+        # A copy: callers await while iterating, and must not touch the index
+        return dict(self._active)
     
     def get_banned_users(self):
-        return {k: v for k, v in self.data['users'].items() if int(k) in self.data['banned']}
+        users = self.data['users']
+        return {str(uid): users[str(uid)] for uid in self._banned if str(uid) in users}
     
     def ban_user(self, uid):
-        if uid not in self.data['banned']:
+        if uid not in self._banned:
+            self._banned.add(uid)
             self.data['banned'].append(uid)
+            self._put('banned', uid, True)
+            self._active.pop(str(uid), None)
             if str(uid) in self.data['users']:
+                self._counts['banned_users'] += 1
                 self.data['users'][str(uid)]['is_active'] = False
-            self.save()
+                self._put('users', str(uid), self.data['users'][str(uid)])
     
     def unban_user(self, uid):
-        if uid in self.data['banned']:
+        if uid in self._banned:
+            self._banned.discard(uid)
             self.data['banned'].remove(uid)
+            self._delete('banned', uid)
             if str(uid) in self.data['users']:
+                self._counts['banned_users'] -= 1
                 self.data['users'][str(uid)]['is_active'] = True
-            self.save()
+                if self.data['users'][str(uid)].get('reachable', True):
+                    self._active[str(uid)] = self.data['users'][str(uid)]
+                self._put('users', str(uid), self.data['users'][str(uid)])
     
     def is_banned(self, uid):
-        return uid in self.data['banned']
+        return uid in self._banned
     
     def add_plan(self, days, price, upi_id):
         plan = {
-            'id': len(self.data['plans']) + 1,
+            'id': max(self._plans, default=0) + 1,
             'days': days,
             'price': price,
             'upi_id': upi_id,
             'created': datetime.now().isoformat()
         }
         self.data['plans'].append(plan)
-        self.save()
+        self._plans[plan['id']] = plan
+        self._put('plans', plan['id'], plan)
         return plan
     
     def get_plans(self):
         return self.data['plans']
     
+    def get_plan(self, plan_id):
+        return self._plans.get(plan_id)
+    
     def delete_plan(self, plan_id):
+        if self._plans.pop(plan_id, None) is None:
+            return
         self.data['plans'] = [p for p in self.data['plans'] if p['id'] != plan_id]
-        self.save()
+        self._delete('plans', plan_id)
     
     def add_pending_payment(self, user_id, plan_id, screenshot):
-        plan = next((p for p in self.data['plans'] if p['id'] == plan_id), None)
+        plan = self._plans.get(plan_id)
         if not plan:
             return None
         
@@ -113,30 +223,39 @@ class Database:
             'status': 'pending'
         }
         self.data['pending_payments'].append(payment)
-        self.save()
+        self._payments[payment['id']] = payment
+        self._pending[payment['id']] = payment
+        self._put('pending_payments', payment['id'], payment)
         return payment
     
     def get_pending_payments(self):
-        return [p for p in self.data['pending_payments'] if p['status'] == 'pending']
+        return list(self._pending.values())
+    
+    def get_payment(self, payment_id):
+        return self._payments.get(payment_id)
+    
+    def _set_payment_status(self, payment_id, status):
+        p = self._payments.get(payment_id)
+        if p:
+            p['status'] = status
+            self._pending.pop(payment_id, None)
+            self._put('pending_payments', payment_id, p)
+        return p
     
     def approve_payment(self, payment_id):
-        for p in self.data['pending_payments']:
-            if p['id'] == payment_id:
-                p['status'] = 'approved'
-                self.save()
-                return p
-        return None
+        return self._set_payment_status(payment_id, 'approved')
     
     def reject_payment(self, payment_id):
-        for p in self.data['pending_payments']:
-            if p['id'] == payment_id:
-                p['status'] = 'rejected'
-                self.save()
-                return True
-        return False
+        return self._set_payment_status(payment_id, 'rejected') is not None
     
     def add_cloned_bot(self, user_id, bot_token, plan_days):
         expiry = datetime.now() + timedelta(days=plan_days)
+        old = self.data['cloned_bots'].get(str(user_id))
+        if not (old and old.get('active')):
+            self._counts['active_clones'] += 1
+        else:
+            self._clone_bots.pop(old['bot_token'].split(':')[0], None)
+        self._clone_bots[bot_token.split(':')[0]] = user_id
         self.data['cloned_bots'][str(user_id)] = {
             'bot_token': bot_token,
             'created': datetime.now().isoformat(),
@@ -144,28 +263,146 @@ class Database:
             'plan_days': plan_days,
             'active': True
         }
-        self.save()
+        self._put('cloned_bots', str(user_id), self.data['cloned_bots'][str(user_id)])
+        if self.on_clone_added:
+            self.on_clone_added(user_id)
     
     def get_cloned_bot(self, user_id):
+        # Read-only: deactivation is the expiry scheduler's job
         bot = self.data['cloned_bots'].get(str(user_id))
-        if bot and bot['active']:
-            expiry = datetime.fromisoformat(bot['expiry'])
-            if datetime.now() > expiry:
-                bot['active'] = False
-                self.save()
-                return None
+        if bot and bot['active'] and datetime.now() <= datetime.fromisoformat(bot['expiry']):
             return bot
         return None
     
+    def get_clone_owner(self, bot_token):
+        """Buyer whose active clone runs this bot (any token of it), or None."""
+        return self._clone_bots.get(bot_token.split(':')[0])
+    
+    def get_active_clones(self):
+        return {k: v for k, v in self.data['cloned_bots'].items() if v.get('active', False)}
+    
+    def expire_clones(self, user_ids):
+        """Deactivate clones in bulk; returns the ids that were actually active."""
+        expired = []
+        for uid in user_ids:
+            bot = self.data['cloned_bots'].get(str(uid))
+            if bot and bot['active']:
+                bot['active'] = False
+                self._counts['active_clones'] -= 1
+                self._clone_bots.pop(bot['bot_token'].split(':')[0], None)
+                self._put('cloned_bots', str(uid), bot)
+                expired.append(uid)
+        return expired
+    
+    def mark_clone_reminded(self, user_id):
+        bot = self.data['cloned_bots'].get(str(user_id))
+        if bot:
+            bot['reminded'] = True
+            self._put('cloned_bots', str(user_id), bot)
+    
     def map_message(self, user_id, owner_msg_id):
-        self.data['message_map'][str(owner_msg_id)] = user_id
-        self.save()
+        self.routes.put(str(owner_msg_id), user_id)
     
     def get_user_from_msg(self, owner_msg_id):
-        return self.data['message_map'].get(str(owner_msg_id))
+        return self.routes.get(str(owner_msg_id))
+    
+    def create_broadcast(self, from_chat_id, message_id, targets, status_chat, status_msg, media=None):
+        broadcasts = self.data.setdefault('broadcasts', {})
+        job = {
+            'id': max(map(int, broadcasts), default=0) + 1,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'media': media,
+            'status_chat': status_chat,
+            'status_msg': status_msg,
+            'total': len(targets),
+            'cursor': 0,
+            'sent': [],
+            'failed': [],
+            'sent_count': 0,
+            'failed_count': 0,
+            'state': 'running',
+            'created': datetime.now().isoformat()
+        }
+        key = str(job['id'])
+        broadcasts[key] = job
+        # The audience is written once, apart from the progress record
+        self.data.setdefault('broadcast_targets', {})[key] = targets
+        self._put('broadcast_targets', key, targets)
+        self._put('broadcasts', key, job)
+        return job
+    
+    def get_broadcast(self, job_id):
+        return self.data.get('broadcasts', {}).get(str(job_id))
+    
+    def get_broadcast_targets(self, job_id):
+        return self.data.get('broadcast_targets', {}).get(str(job_id), [])
+    
+    def get_unfinished_broadcasts(self):
+        return [j for j in self.data.get('broadcasts', {}).values() if j['state'] in ('running', 'paused')]
+    
+    def save_broadcast(self, job):
+        key = str(job['id'])
+        self.data.setdefault('broadcasts', {})[key] = job
+        self._put('broadcasts', key, job)
+        if job['state'] in ('done', 'cancelled') and key in self.data.get('broadcast_targets', {}):
+            del self.data['broadcast_targets'][key]
+            self._delete('broadcast_targets', key)
+    
+    def count_relay(self):
+        self._counts['messages_relayed'] += 1
+        self.data['meta']['messages_relayed'] = self._counts['messages_relayed']
+        self._put('meta', 'messages_relayed', self._counts['messages_relayed'])
+    
+    def get_stats(self):
+        """Live counters, cheap enough to read on every tap of the Statistics panel."""
+        return {
+            'total_users': len(self.data['users']),
+            'active_users': len(self._active),
+            'banned_users': self._counts['banned_users'],
+            'unreachable_users': self._counts['unreachable_users'],
+            'plans': len(self._plans),
+            'pending_payments': len(self._pending),
+            'active_clones': self._counts['active_clones'],
+            'messages_relayed': self._counts['messages_relayed']
+        }
+    
+    def get_routing_stats(self):
+        return self.routes.stats()
+    
+    def load_handler_data(self, table):
+        """Persisted user_data / chat_data, keyed by id."""
+        return {int(k): v for k, v in self.data.get(table, {}).items()}
+    
+    def save_handler_data(self, table, key, data):
+        entries = self.data.setdefault(table, {})
+        if data:
+            entries[str(key)] = dict(data)
+            self._put(table, str(key), entries[str(key)])
+        elif entries.pop(str(key), None) is not None:
+            self._delete(table, str(key))
+    
+    def load_conversations(self, name):
+        prefix = f"{name}:"
+        return {
+            tuple(int(part) for part in k[len(prefix):].split(',')): state
+            for k, state in self.data.get('conversations', {}).items() if k.startswith(prefix)
+        }
+    
+    def save_conversation(self, name, key, state):
+        # Only live conversations are kept; an ended one (state None) is deleted
+        entries = self.data.setdefault('conversations', {})
+        k = f"{name}:{','.join(str(part) for part in key)}"
+        if state is not None:
+            entries[k] = state
+            self._put('conversations', k, state)
+        elif entries.pop(k, None) is not None:
+            self._delete('conversations', k)
     
     def get_random_greeting(self):
         import random
         return random.choice(self.data['greetings'])
 
-db = Database()
+def get_db(context):
+    """The Database of the bot handling this update (clone bots each keep their own)."""
+    return context.bot_data['db']
@@ -0,0 +1,31 @@
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+DELIVERED = 'delivered'
+UNREACHABLE = 'unreachable'
+TRANSIENT = 'transient'
+FAILED = 'failed'
+
+# BadRequest descriptions that mean the chat is gone for good
+_GONE = (
+    'chat not found',
+    'user not found',
+    'user is deactivated',
+    'peer_id_invalid',
+    'bot was blocked',
+    'bot can\'t initiate conversation',
+)
+
+
+def classify_error(error):
+    """Sort a failed send into UNREACHABLE, TRANSIENT or FAILED."""
+    if isinstance(error, Forbidden):
+        # Blocked the bot, deleted the account, kicked the bot...
+        return UNREACHABLE
+    if isinstance(error, BadRequest):
+        text = str(error).lower()
+        if any(marker in text for marker in _GONE):
+            return UNREACHABLE
+        return FAILED
+    if isinstance(error, (RetryAfter, TimedOut, NetworkError)):
+        return TRANSIENT
+    return FAILED
@@ -0,0 +1,119 @@
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+
+from outbox import RELAY, outbox_for
+
+logger = logging.getLogger(__name__)
+
+EXPIRE = 'expire'
+REMIND = 'remind'
+
+
+class CloneExpiryScheduler:
+    """Deactivates clone bots when they expire, driven by a min-heap.
+
+    Every active clone contributes an expire entry (and a reminder entry
+    reminder_days ahead) keyed by timestamp. Only one JobQueue job is ever
+    pending: the one for the heap's head. Entries carry the clone's expiry
+    string, so a renewed or removed clone simply leaves stale entries behind
+    that are skipped when they surface.
+    """
+
+    def __init__(self, db, reminder_days=1):
+        self.db = db
+        self.reminder_days = reminder_days
+        self.heap = []
+        self.listeners = []
+        self.job_queue = None
+        self.job = None
+
+    def add_listener(self, callback):
+        """callback(user_ids) is awaited after clones are deactivated."""
+        self.listeners.append(callback)
+
+    def start(self, job_queue):
+        self.job_queue = job_queue
+        for uid, clone in self.db.get_active_clones().items():
+            self._push(int(uid), clone)
+        # Whatever path sells or renews a clone, its expiry is scheduled
+        self.db.on_clone_added = self.track
+        logger.info(f"⏳ Tracking expiry of {len(self.heap)} clone events")
+        self._reschedule()
+
+    def track(self, user_id):
+        """Register a newly added or renewed clone."""
+        clone = self.db.get_cloned_bot(user_id)
+        if clone:
+            self._push(user_id, clone)
+            self._reschedule()
+
+    def _push(self, user_id, clone):
+        expiry = datetime.fromisoformat(clone['expiry'])
+        heapq.heappush(self.heap, (expiry.timestamp(), EXPIRE, user_id, clone['expiry']))
+        remind_at = expiry - timedelta(days=self.reminder_days)
+        if self.reminder_days > 0 and not clone.get('reminded') and remind_at > datetime.now():
+            heapq.heappush(self.heap, (remind_at.timestamp(), REMIND, user_id, clone['expiry']))
+
+    def _reschedule(self):
+        if self.job_queue is None:
+            return
+        if self.job is not None:
+            self.job.schedule_removal()
+            self.job = None
+        if self.heap:
+            delay = max(0, self.heap[0][0] - time.time())
+            self.job = self.job_queue.run_once(self._run, delay, name='clone_expiry')
+
+    def _is_current(self, user_id, expiry):
+        clone = self.db.data['cloned_bots'].get(str(user_id))
+        return clone is not None and clone.get('active') and clone['expiry'] == expiry
+
+    async def _run(self, context):
+        self.job = None
+        now = time.time()
+        due_expire = []
+        due_remind = []
+        while self.heap and self.heap[0][0] <= now:
+            _, kind, user_id, expiry = heapq.heappop(self.heap)
+            if not self._is_current(user_id, expiry):
+                continue
+            (due_expire if kind == EXPIRE else due_remind).append(user_id)
+
+        expired = self.db.expire_clones(due_expire)
+        if expired:
+            logger.info(f"⌛ {len(expired)} clone bot(s) expired")
+            for callback in self.listeners:
+                try:
+                    await callback(expired)
+                except Exception as e:
+                    logger.error(f"❌ Clone expiry listener failed: {e}")
+
+        for user_id in expired:
+            try:
+                await outbox_for(context.bot).call(
+                    RELAY,
+                    context.bot.send_message,
+                    user_id,
+                    "⌛ Your clone bot has expired.\n\n"
+                    "Purchase a new plan to keep it running!"
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Could not notify {user_id} about expiry: {e}")
+
+        for user_id in due_remind:
+            self.db.mark_clone_reminded(user_id)
+            try:
+                await outbox_for(context.bot).call(
+                    RELAY,
+                    context.bot.send_message,
+                    user_id,
+                    f"⏰ Your clone bot expires in {self.reminder_days} day{'s' if self.reminder_days > 1 else ''}.\n\n"
+                    "Purchase a plan again to renew it!"
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Could not send renewal reminder to {user_id}: {e}")
+
+        self._reschedule()
+
@@ -0,0 +1,68 @@
+import os
+import time
+
+
+class FloodGuard:
+    """Per-user token bucket in front of the relay path.
+
+    Each user holds `burst` tokens refilled at `refill` per second; a relayed
+    message costs one. Messages without a token are counted instead of
+    forwarded so the owner can be told about them in one summary. State is a
+    small fixed-size list per user and idle users are dropped by sweep().
+    """
+
+    def __init__(self, burst=5, refill=0.5, idle_ttl=600):
+        self.burst = burst
+        self.refill = refill
+        self.idle_ttl = idle_ttl
+        # uid -> [tokens, last update, suppressed messages]
+        self.entries = {}
+        self.throttled = 0
+
+    def allow(self, uid):
+        now = time.monotonic()
+        entry = self.entries.get(uid)
+        if entry is None:
+            entry = self.entries[uid] = [self.burst, now, 0]
+        else:
+            entry[0] = min(self.burst, entry[0] + (now - entry[1]) * self.refill)
+            entry[1] = now
+        if entry[0] >= 1:
+            entry[0] -= 1
+            return True
+        entry[2] += 1
+        self.throttled += 1
+        return False
+
+    def take_summaries(self):
+        """[(uid, suppressed count)] since the last call, resetting the counts."""
+        summaries = []
+        for uid, entry in self.entries.items():
+            if entry[2]:
+                summaries.append((uid, entry[2]))
+                entry[2] = 0
+        return summaries
+
+    def sweep(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for uid in [uid for uid, e in self.entries.items() if e[1] < cutoff and not e[2]]:
+            del self.entries[uid]
+
+
+_guards = {}
+
+
+def flood_guard_for(bot):
+    """The FloodGuard of a bot token (each bot relays to its own owner)."""
+    guard = _guards.get(bot.token)
+    if guard is None:
+        guard = _guards[bot.token] = FloodGuard(
+            burst=int(os.getenv('FLOOD_BURST', '5')),
+            refill=float(os.getenv('FLOOD_REFILL', '0.5')),
+            idle_ttl=float(os.getenv('FLOOD_IDLE_TTL', '600'))
+        )
+    return guard
+
+
+def release_flood_guard(bot):
+    _guards.pop(bot.token, None)
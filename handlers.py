@@ -0,0 +1,305 @@
+import os
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    MessageHandler,
+    CallbackQueryHandler,
+    ConversationHandler,
+    TypeHandler,
+    filters
+)
+
+from albums import albums
+from broadcast import BroadcastEngine, BroadcastManager
+from database import get_db
+from delivery import UNREACHABLE, classify_error
+from middleware import BanGate, UpdateTypeGate, allowed_updates
+from router import CallbackRouter
+from outbox import OWNER, RELAY, outbox_for
+from user_handlers import (
+    user_panel,
+    handle_user_message,
+    flood_summary_job,
+    user_send_callback,
+    user_plans_callback,
+    plan_selected,
+    handle_payment_screenshot,
+    handle_bot_token,
+    user_mybot_callback,
+    user_help_callback,
+    cancel_payment_callback
+)
+from owner_handlers import (
+    owner_panel,
+    owner_stats_callback,
+    owner_active_callback,
+    owner_banned_callback,
+    user_info_callback,
+    ban_user_callback,
+    unban_user_callback,
+    owner_ban_callback,
+    owner_unban_callback,
+    owner_broadcast_callback,
+    receive_broadcast,
+    owner_plans_callback,
+    create_plan_callback,
+    plan_days_handler,
+    plan_price_handler,
+    plan_upi_handler,
+    delete_plan_callback,
+    owner_payments_callback,
+    owner_broadcasts_callback,
+    broadcast_control_callback,
+    owner_latency_callback,
+    approve_payment_callback,
+    reject_payment_callback,
+    cancel_conversation,
+    BROADCAST_MSG,
+    PLAN_DAYS,
+    PLAN_PRICE,
+    PLAN_UPI
+)
+
+logger = logging.getLogger(__name__)
+
+FLOOD_SUMMARY_INTERVAL = float(os.getenv('FLOOD_SUMMARY_INTERVAL', '15'))
+
+async def start(update: Update, context):
+    user_id = update.effective_user.id
+    
+    if user_id == context.bot_data['OWNER_ID']:
+        await owner_panel(update, context)
+    else:
+        await user_panel(update, context)
+
+async def plans_command(update: Update, context):
+    """Handle /plans command"""
+    plans = get_db(context).get_plans()
+    
+    if not plans:
+        await outbox_for(context.bot).call(RELAY, update.message.reply_text, "📋 No subscription plans available yet.")
+        return
+    
+    text = "🤖 Clone Bot Subscription Plans\n━━━━━━━━━━━━━━━━\n\nChoose a plan:\n"
+    
+    keyboard = []
+    for plan in plans:
+        button_text = f"{plan['days']} Day{'s' if plan['days'] > 1 else ''} - ₹{plan['price']}"
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"plan_{plan['id']}")])
+    
+    await outbox_for(context.bot).call(RELAY, update.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def report_failed_reply(context, msg, target_user, error):
+    if classify_error(error) == UNREACHABLE:
+        # Blocked the bot or deleted the account: stop including them in fanouts
+        get_db(context).mark_unreachable([target_user])
+        await outbox_for(context.bot).call(OWNER, msg.reply_text, f"🚫 User {target_user} is unreachable (blocked the bot or deleted the account).")
+        logger.info(f"🧹 User {target_user} marked unreachable")
+    else:
+        await outbox_for(context.bot).call(OWNER, msg.reply_text, f"❌ Failed to send: {error}")
+
+async def handle_text_message(update: Update, context):
+    db = get_db(context)
+    user_id = update.effective_user.id
+    msg = update.message
+    
+    # Owner actions
+    if user_id == context.bot_data['OWNER_ID']:
+        # Check for ban action
+        if 'awaiting_ban' in context.user_data and context.user_data['awaiting_ban']:
+            try:
+                ban_id = int(msg.text)
+                db.ban_user(ban_id)
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, f"✅ User {ban_id} has been banned!")
+                context.user_data['awaiting_ban'] = False
+                logger.info(f"🚫 User {ban_id} banned")
+                return
+            except:
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, "❌ Invalid ID. Send numbers only:")
+                return
+        
+        # Check for unban action
+        if 'awaiting_unban' in context.user_data and context.user_data['awaiting_unban']:
+            try:
+                unban_id = int(msg.text)
+                db.unban_user(unban_id)
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, f"✅ User {unban_id} has been unbanned!")
+                context.user_data['awaiting_unban'] = False
+                logger.info(f"✅ User {unban_id} unbanned")
+                return
+            except:
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, "❌ Invalid ID. Send numbers only:")
+                return
+        
+        # Check for delete plan action
+        if 'awaiting_delete_plan' in context.user_data and context.user_data['awaiting_delete_plan']:
+            try:
+                plan_id = int(msg.text)
+                db.delete_plan(plan_id)
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, f"✅ Plan #{plan_id} deleted!")
+                context.user_data['awaiting_delete_plan'] = False
+                logger.info(f"🗑 Plan {plan_id} deleted")
+                return
+            except:
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, "❌ Invalid plan ID:")
+                return
+        
+        # Check if replying to user message
+        if msg.reply_to_message:
+            target_user = db.get_user_from_msg(msg.reply_to_message.message_id)
+            if target_user:
+                try:
+                    await outbox_for(context.bot).call(OWNER, context.bot.send_message, target_user, msg.text)
+                    await outbox_for(context.bot).call(OWNER, msg.reply_text, f"✅ Reply sent to user {target_user}!")
+                    logger.info(f"�� Reply sent to user {target_user}")
+                    return
+                except Exception as e:
+                    await report_failed_reply(context, msg, target_user, e)
+                    return
+    
+    # Approved clone buyer sending their bot token
+    elif context.user_data.get('awaiting_token'):
+        await handle_bot_token(update, context)
+        return
+    
+    # Regular user sending message
+    await handle_user_message(update, context)
+
+async def handle_media_message(update: Update, context):
+    db = get_db(context)
+    user_id = update.effective_user.id
+    msg = update.message
+    
+    # Later parts of an album that is being collected (relay or broadcast)
+    if albums.join(msg):
+        return
+    
+    # Check if owner replying
+    if user_id == context.bot_data['OWNER_ID'] and msg.reply_to_message:
+        target_user = db.get_user_from_msg(msg.reply_to_message.message_id)
+        if target_user:
+            try:
+                await outbox_for(context.bot).call(OWNER, context.bot.copy_message, target_user, msg.chat_id, msg.message_id)
+                
+                await outbox_for(context.bot).call(OWNER, msg.reply_text, f"✅ Media sent to user {target_user}!")
+                logger.info(f"📎 Media sent to user {target_user}")
+                return
+            except Exception as e:
+                await report_failed_reply(context, msg, target_user, e)
+                return
+    
+    # Check if user sending payment screenshot
+    if msg.photo and 'selected_plan' in context.user_data:
+        await handle_payment_screenshot(update, context)
+        return
+    
+    # Regular user media
+    await handle_user_message(update, context)
+
+def build_callback_router(is_clone=False):
+    router = CallbackRouter()
+    
+    # User callbacks
+    router.route("user_send", user_send_callback)
+    router.route("user_help", user_help_callback)
+    
+    # Owner callbacks
+    router.route("owner_stats", owner_stats_callback, owner_only=True)
+    router.route("owner_active", owner_active_callback, owner_only=True)
+    router.route("owner_banned", owner_banned_callback, owner_only=True)
+    router.prefix("userinfo_", user_info_callback, owner_only=True)
+    router.prefix("ban_", ban_user_callback, owner_only=True)
+    router.prefix("unban_", unban_user_callback, owner_only=True)
+    router.route("owner_ban", owner_ban_callback, owner_only=True)
+    router.route("owner_unban", owner_unban_callback, owner_only=True)
+    router.route("owner_broadcast", owner_broadcast_callback, owner_only=True)
+    router.route("owner_broadcasts", owner_broadcasts_callback, owner_only=True)
+    router.prefix("bcast_", broadcast_control_callback, owner_only=True)
+    router.route("owner_latency", owner_latency_callback, owner_only=True)
+    
+    if is_clone:
+        return router
+    
+    # Clone sales (main bot only)
+    router.route("user_plans", user_plans_callback)
+    router.prefix("plan_", plan_selected)
+    router.route("user_mybot", user_mybot_callback)
+    router.route("cancel_payment", cancel_payment_callback)
+    router.route("owner_plans", owner_plans_callback, owner_only=True)
+    router.route("create_plan", create_plan_callback, owner_only=True)
+    router.route("delete_plan", delete_plan_callback, owner_only=True)
+    router.route("owner_payments", owner_payments_callback, owner_only=True)
+    
+    # Payment approval/rejection
+    router.prefix("approve_", approve_payment_callback, owner_only=True)
+    router.prefix("reject_", reject_payment_callback, owner_only=True)
+    
+    return router
+
+def setup_bot(app: Application, owner_id, owner_name, database, is_clone=False):
+    """Give app its owner, database and handlers; used for the main bot and every clone."""
+    app.bot_data['OWNER_ID'] = owner_id
+    app.bot_data['OWNER_NAME'] = owner_name
+    app.bot_data['IS_CLONE'] = is_clone
+    app.bot_data['db'] = database
+    app.bot_data['broadcasts'] = BroadcastManager(database, BroadcastEngine())
+    
+    # Broadcast conversation
+    broadcast_conv = ConversationHandler(
+        entry_points=[CallbackQueryHandler(owner_broadcast_callback, pattern="^owner_broadcast$")],
+        states={
+            BROADCAST_MSG: [MessageHandler(filters.ALL & ~filters.COMMAND, receive_broadcast)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel_conversation)],
+        name="broadcast",
+        persistent=True
+    )
+    
+    # Drop updates from banned users before any other handler sees them
+    ban_gate = BanGate()
+    app.bot_data['ban_gate'] = ban_gate
+    app.add_handler(TypeHandler(Update, ban_gate), group=-1)
+    
+    # Add handlers
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(broadcast_conv)
+    if not is_clone:
+        # Create plan conversation
+        plan_conv = ConversationHandler(
+            entry_points=[CallbackQueryHandler(create_plan_callback, pattern="^create_plan$")],
+            states={
+                PLAN_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_days_handler)],
+                PLAN_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_price_handler)],
+                PLAN_UPI: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_upi_handler)]
+            },
+            fallbacks=[CommandHandler("cancel", cancel_conversation)],
+            name="plan",
+            persistent=True
+        )
+        app.add_handler(CommandHandler("plans", plans_command))
+        app.add_handler(plan_conv)
+    callback_router = build_callback_router(is_clone)
+    app.bot_data['callback_router'] = callback_router
+    app.add_handler(CallbackQueryHandler(callback_router.dispatch))
+    app.add_handler(MessageHandler(
+        filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.VOICE | filters.AUDIO | filters.VIDEO_NOTE,
+        handle_media_message
+    ))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    
+    # Ask Telegram only for the update types the handlers above consume
+    update_gate = UpdateTypeGate(allowed_updates(app))
+    app.bot_data['update_gate'] = update_gate
+    app.add_handler(TypeHandler(Update, update_gate), group=-2)
+
+async def post_init(app: Application):
+    # Pick up broadcasts interrupted by a restart
+    app.bot_data['broadcasts'].resume_all(app.bot)
+    # Summarize held-back messages from flooding users and forget idle ones
+    app.job_queue.run_repeating(flood_summary_job, interval=FLOOD_SUMMARY_INTERVAL, first=FLOOD_SUMMARY_INTERVAL)
+
+async def post_shutdown(app: Application):
+    # Record broadcast progress (a clone's tenant database stays open in the registry)
+    app.bot_data['broadcasts'].checkpoint_all()
@@ -0,0 +1,102 @@
+import logging
+from collections import Counter
+
+from telegram import Update
+from telegram.ext import (
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    MessageHandler,
+    TypeHandler
+)
+
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class BanGate:
+    """Pre-dispatch filter: drops every update from a banned user.
+
+    Registered as a TypeHandler in a group ahead of all other handlers, so a
+    banned sender costs one set lookup and nothing else - no handler, no
+    database write, no API call.
+    """
+
+    def __init__(self):
+        self.rejected = 0
+
+    async def __call__(self, update, context):
+        user = update.effective_user
+        if user is None or user.id == context.bot_data.get('OWNER_ID'):
+            return
+        if get_db(context).is_banned(user.id):
+            self.rejected += 1
+            raise ApplicationHandlerStop
+
+
+# Update types each handler class can fire on. Edited messages are left out on
+# purpose: relaying an edit would deliver the same message to the owner twice.
+HANDLER_UPDATE_TYPES = (
+    (CallbackQueryHandler, (Update.CALLBACK_QUERY,)),
+    (CommandHandler, (Update.MESSAGE,)),
+    (MessageHandler, (Update.MESSAGE,))
+)
+
+
+def allowed_updates(application):
+    """Smallest allowed_updates list covering every registered handler.
+
+    ConversationHandlers are walked recursively; TypeHandlers (the gates in
+    this module) only see what the other handlers ask for. A handler class
+    not in HANDLER_UPDATE_TYPES falls back to every update type.
+    """
+    types = set()
+
+    def walk(handlers):
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                walk(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    walk(state_handlers)
+                walk(handler.fallbacks)
+            elif not isinstance(handler, TypeHandler):
+                for cls, names in HANDLER_UPDATE_TYPES:
+                    if isinstance(handler, cls):
+                        types.update(names)
+                        break
+                else:
+                    logger.warning(f"⚠️ No update types known for {type(handler).__name__}, fetching all")
+                    types.update(Update.ALL_TYPES)
+
+    for handlers in application.handlers.values():
+        walk(handlers)
+    return sorted(types)
+
+
+class UpdateTypeGate:
+    """Pre-dispatch filter: drops update types no handler asked for.
+
+    Telegram already filters by allowed_updates, but updates queued before
+    the list changed (or posted to the webhook by hand) still arrive. They
+    are counted per type and stopped before reaching any handler filter.
+    """
+
+    def __init__(self, allowed):
+        self.allowed = list(allowed)
+        self.accepted = frozenset(self.allowed)
+        self.dropped = Counter()
+
+    @staticmethod
+    def update_type(update):
+        for name in Update.ALL_TYPES:
+            if getattr(update, name, None) is not None:
+                return name
+        return 'unknown'
+
+    async def __call__(self, update, context):
+        kind = self.update_type(update)
+        if kind not in self.accepted:
+            self.dropped[kind] += 1
+            raise ApplicationHandlerStop
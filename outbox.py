@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import logging
+import os
+
+from telegram.error import RetryAfter
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+OWNER = 0       # owner replies and panels, payment notifications and approvals
+RELAY = 1       # user messages relayed to the owner, replies to users' commands
+GREETING = 2    # acknowledgements sent back to users
+BROADCAST = 3   # fanout
+
+CLASS_NAMES = {OWNER: 'owner', RELAY: 'relay', GREETING: 'greeting', BROADCAST: 'broadcast'}
+
+
+class Outbox:
+    """Single outbound queue per bot, drained by a few workers under one rate limit.
+
+    Calls are ordered by priority class, so a draining broadcast never delays
+    an owner reply by more than the requests already in flight. When the
+    queue is deeper than max_depth, greetings are shed (dropped, the call
+    returns None) and broadcast submitters wait until it drains.
+    """
+
+    def __init__(self, rate=28, workers=16, max_depth=500, shed=(GREETING,), backpressure=(BROADCAST,)):
+        self.limiter = TokenBucket(rate)
+        self.workers = workers
+        self.max_depth = max_depth
+        self.shed_classes = shed
+        self.backpressure_classes = backpressure
+        self.queue = None
+        self.seq = itertools.count()
+        self.tasks = []
+        self.not_full = None
+
+        self.sent = dict.fromkeys(CLASS_NAMES, 0)
+        self.shed = dict.fromkeys(CLASS_NAMES, 0)
+        self.retried = 0
+
+    def _ensure_started(self):
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+            self.not_full = asyncio.Event()
+            self.not_full.set()
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def call(self, priority, method, *args, **kwargs):
+        """Queue method(*args, **kwargs) and return its result once sent."""
+        self._ensure_started()
+
+        if self.queue.qsize() >= self.max_depth:
+            if priority in self.shed_classes:
+                self.shed[priority] += 1
+                return None
+            if priority in self.backpressure_classes:
+                while self.queue.qsize() >= self.max_depth:
+                    self.not_full.clear()
+                    await self.not_full.wait()
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self.seq), method, args, kwargs, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            priority, _, method, args, kwargs, future = item
+            if self.queue.qsize() < self.max_depth:
+                self.not_full.set()
+            if future.done():
+                continue
+
+            await self.limiter.take()
+            try:
+                result = await method(*args, **kwargs)
+            except RetryAfter as e:
+                # Back off globally and retry in the same place in line
+                logger.warning(f"⏸ Flood limit hit, pausing outbound sends for {e.retry_after}s")
+                self.limiter.pause(e.retry_after)
+                self.retried += 1
+                self.queue.put_nowait(item)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.sent[priority] += 1
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize() if self.queue else 0,
+            'sent': {CLASS_NAMES[k]: v for k, v in self.sent.items()},
+            'shed': {CLASS_NAMES[k]: v for k, v in self.shed.items()},
+            'retried': self.retried
+        }
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue = None
+
+
+_outboxes = {}
+
+
+def outbox_for(bot):
+    """The Outbox of a bot token (rate limits are per bot)."""
+    box = _outboxes.get(bot.token)
+    if box is None:
+        box = _outboxes[bot.token] = Outbox(
+            rate=float(os.getenv('OUTBOX_RATE', '28')),
+            workers=int(os.getenv('OUTBOX_WORKERS', '16')),
+            max_depth=int(os.getenv('OUTBOX_MAX_DEPTH', '500'))
+        )
+    return box
+
+
+async def release_outbox(bot):
+    """Stop and forget the Outbox of a bot that is being shut down."""
+    box = _outboxes.pop(bot.token, None)
+    if box is not None:
+        await box.close()
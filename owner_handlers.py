@@ -1,6 +1,9 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
-from database import db
+from database import get_db
+from albums import albums, describe
+from outbox import OWNER, outbox_for
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,14 +24,20 @@ async def owner_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("👥 Active Users", callback_data="owner_active"),
             InlineKeyboardButton("🚫 Banned Users", callback_data="owner_banned")
         ],
-        [InlineKeyboardButton("📢 Broadcast Message", callback_data="owner_broadcast")],
+        [
+            InlineKeyboardButton("📢 Broadcast Message", callback_data="owner_broadcast"),
+            InlineKeyboardButton("📡 Broadcasts", callback_data="owner_broadcasts")
+        ],
         [
             InlineKeyboardButton("🚫 Ban User", callback_data="owner_ban"),
             InlineKeyboardButton("✅ Unban User", callback_data="owner_unban")
-        ],
-        [InlineKeyboardButton("📋 Manage Plans", callback_data="owner_plans")],
-        [InlineKeyboardButton("💳 Pending Payments", callback_data="owner_payments")]
+        ]
     ]
+    # Selling clones is the main bot's business
+    if not context.bot_data.get('IS_CLONE'):
+        keyboard.append([InlineKeyboardButton("📋 Manage Plans", callback_data="owner_plans")])
+        keyboard.append([InlineKeyboardButton("💳 Pending Payments", callback_data="owner_payments")])
+    keyboard.append([InlineKeyboardButton("⏱ Panel Latency", callback_data="owner_latency")])
     
     owner_name = context.bot_data.get('OWNER_NAME', 'Owner')
     text = f"""
@@ -37,40 +46,55 @@ async def owner_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Full control access
 """
     
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(OWNER, update.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def owner_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
-    all_users = db.get_all_users()
-    active = db.get_active_users()
-    banned = db.get_banned_users()
-    plans = db.get_plans()
-    pending = db.get_pending_payments()
-    clones = db.data['cloned_bots']
+    stats = db.get_stats()
+    outbox = outbox_for(context.bot).stats()
+    ban_gate = context.bot_data.get('ban_gate')
+    update_gate = context.bot_data.get('update_gate')
+    dropped = update_gate.dropped if update_gate else {}
+    dropped_types = ', '.join(f"{kind}: {count}" for kind, count in dropped.items())
+    clones = context.bot_data.get('clones')
+    clone_stats = clones.stats() if clones else {}
+    running = f" ({clone_stats['running']} running, {clone_stats['sleeping']} hibernated)" if clones else ''
     
     text = f"""
 📊 Bot Statistics
 ━━━━━━━━━━━━━━━━
-�� Total Users: {len(all_users)}
-✅ Active Users: {len(active)}
-🚫 Banned Users: {len(banned)}
-📋 Subscription Plans: {len(plans)}
-💳 Pending Payments: {len(pending)}
-🤖 Active Clones: {sum(1 for c in clones.values() if c.get('active', False))}
+�� Total Users: {stats['total_users']}
+✅ Active Users: {stats['active_users']}
+🚫 Banned Users: {stats['banned_users']}
+🧹 Unreachable Users: {stats['unreachable_users']}
+📋 Subscription Plans: {stats['plans']}
+💳 Pending Payments: {stats['pending_payments']}
+🤖 Active Clones: {stats['active_clones']}{running}
+📨 Messages Relayed: {stats['messages_relayed']}
+🛡 Updates Dropped (banned): {ban_gate.rejected if ban_gate else 0}
+📥 Updates Dropped (unhandled type): {sum(dropped.values())} {dropped_types}
+📮 Send Queue: {outbox['depth']} waiting, {sum(outbox['shed'].values())} dropped
 """
+    for shard in clone_stats.get('shards', []):
+        text += (
+            f"🧩 Shard {shard['shard']}: {shard.get('running', '?')} running, {shard.get('sleeping', '?')} hibernated, "
+            f"CPU {shard.get('cpu', '?')}%, {shard['restarts']} restarts\n"
+        )
     
-    await query.message.reply_text(text)
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text)
 
 async def owner_active_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     active = db.get_active_users()
     
     if not active:
-        await query.message.reply_text("No active users yet.")
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "No active users yet.")
         return
     
     text = f"✅ Active Users ({len(active)})\n━━━━━━━━━━━━━━━━\n\n"
@@ -85,16 +109,17 @@ async def owner_active_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if len(active) > 50:
         text += f"Showing first 50 users...\n"
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def owner_banned_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     banned = db.get_banned_users()
     
     if not banned:
-        await query.message.reply_text("No banned users.")
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "No banned users.")
         return
     
     text = f"🚫 Banned Users ({len(banned)})\n━━━━━━━━━━━━━━━━\n\n"
@@ -106,9 +131,10 @@ async def owner_banned_callback(update: Update, context: ContextTypes.DEFAULT_TY
         button_text = f"{name} (@{username})"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=f"userinfo_{uid}")])
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def user_info_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     uid = query.data.split('_')[1]
     
@@ -138,9 +164,10 @@ Joined: {user['joined'][:10]}
     else:
         keyboard.append([InlineKeyboardButton("🚫 Ban User", callback_data=f"ban_{uid}")])
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
 async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     uid = int(query.data.split('_')[1])
     
@@ -148,11 +175,12 @@ async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("✅ User banned!", show_alert=True)
     
     user = db.get_user(uid)
-    await query.message.edit_text(f"✅ User {user['name']} ({uid}) has been banned.")
+    await outbox_for(context.bot).call(OWNER, query.message.edit_text, f"✅ User {user['name']} ({uid}) has been banned.")
     
     logger.info(f"🚫 User {uid} banned by owner")
 
 async def unban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     uid = int(query.data.split('_')[1])
     
@@ -160,7 +188,7 @@ async def unban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer("✅ User unbanned!", show_alert=True)
     
     user = db.get_user(uid)
-    await query.message.edit_text(f"✅ User {user['name']} ({uid}) has been unbanned.")
+    await outbox_for(context.bot).call(OWNER, query.message.edit_text, f"✅ User {user['name']} ({uid}) has been unbanned.")
     
     logger.info(f"✅ User {uid} unbanned by owner")
 
@@ -168,7 +196,9 @@ async def owner_ban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.reply_text,
         "🚫 Ban User\n"
         "━━━━━━━━━━━━━━━━\n\n"
         "Send user ID to ban:\n"
@@ -180,7 +210,9 @@ async def owner_unban_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.reply_text,
         "✅ Unban User\n"
         "━━━━━━━━━━━━━━━━\n\n"
         "Send user ID to unban:\n"
@@ -192,7 +224,9 @@ async def owner_broadcast_callback(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.reply_text,
         "📢 Broadcast Mode\n"
         "━━━━━━━━━━━━━━━━\n\n"
         "Send your message now.\n\n"
@@ -208,44 +242,76 @@ async def owner_broadcast_callback(update: Update, context: ContextTypes.DEFAULT
 
 async def receive_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = update.message
-    users = db.get_active_users()
-    
-    total = len(users)
-    status = await msg.reply_text(f"📤 Broadcasting to {total} users...")
-    
-    success = 0
-    failed = 0
-    
-    for uid in users.keys():
-        try:
-            if msg.text:
-                await context.bot.send_message(int(uid), msg.text)
-            elif msg.photo:
-                await context.bot.send_photo(int(uid), msg.photo[-1].file_id, caption=msg.caption or "")
-            elif msg.video:
-                await context.bot.send_video(int(uid), msg.video.file_id, caption=msg.caption or "")
-            elif msg.document:
-                await context.bot.send_document(int(uid), msg.document.file_id, caption=msg.caption or "")
-            elif msg.voice:
-                await context.bot.send_voice(int(uid), msg.voice.file_id)
-            elif msg.audio:
-                await context.bot.send_audio(int(uid), msg.audio.file_id, caption=msg.caption or "")
-            success += 1
-        except:
-            failed += 1
-    
-    await status.edit_text(
-        f"✅ Broadcast Complete!\n\n"
-        f"📊 Results:\n"
-        f"✅ Sent: {success}\n"
-        f"❌ Failed: {failed}\n"
-        f"📈 Total: {total}"
-    )
     
-    logger.info(f"📢 Broadcast sent: {success} success, {failed} failed")
+    # An album arrives as several updates; broadcast it once all parts are in
+    if msg.media_group_id:
+        albums.start(msg, lambda messages: start_broadcast(context, messages))
+        return ConversationHandler.END
+    
+    await start_broadcast(context, [msg])
     return ConversationHandler.END
 
+async def start_broadcast(context: ContextTypes.DEFAULT_TYPE, messages):
+    db = get_db(context)
+    broadcasts = context.bot_data['broadcasts']
+    msg = messages[0]
+    users = [int(uid) for uid in db.get_active_users()]
+    
+    status = await outbox_for(context.bot).call(OWNER, msg.reply_text, f"📤 Broadcasting to {len(users)} users...")
+    
+    # Runs in the background as a persisted job; the status message carries its controls
+    media = [describe(m) for m in messages] if len(messages) > 1 else None
+    job = broadcasts.create(msg.chat_id, msg.message_id, users, status.chat_id, status.message_id, media=media)
+    broadcasts.start(context.bot, job)
+    
+    logger.info(f"📢 Broadcast #{job['id']} started for {len(users)} users")
+
+async def owner_broadcasts_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
+    broadcasts = context.bot_data['broadcasts']
+    query = update.callback_query
+    await query.answer()
+    
+    jobs = db.get_unfinished_broadcasts()
+    if not jobs:
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "📡 No running or paused broadcasts.")
+        return
+    
+    for job in jobs:
+        text, markup = broadcasts.render(job)
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, text, reply_markup=markup)
+
+async def broadcast_control_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    broadcasts = context.bot_data['broadcasts']
+    query = update.callback_query
+    _, action, job_id = query.data.split('_')
+    job_id = int(job_id)
+    
+    if action == 'pause':
+        job = broadcasts.pause(job_id)
+    elif action == 'resume':
+        job = await broadcasts.resume(context.bot, job_id)
+    else:
+        job = await broadcasts.cancel(context.bot, job_id)
+    
+    if not job:
+        await query.answer("Broadcast not found", show_alert=True)
+        return
+    
+    await query.answer(f"Broadcast #{job_id}: {job['state']}")
+    text, markup = broadcasts.render(job)
+    try:
+        await outbox_for(context.bot).call(OWNER, query.message.edit_text, text, reply_markup=markup)
+    except BadRequest as e:
+        # Usually "message is not modified": the job's own report got there first
+        logger.debug(f"Broadcast #{job_id} status edit skipped: {e}")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not update status of broadcast #{job_id}: {e}")
+    
+    logger.info(f"📢 Broadcast #{job_id} {action} by owner")
+
 async def owner_plans_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
@@ -267,13 +333,15 @@ async def owner_plans_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         [InlineKeyboardButton("➖ Delete Plan", callback_data="delete_plan")]
     ]
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def create_plan_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.reply_text,
         "📋 Create New Plan\n"
         "━━━━━━━━━━━━━━━━\n\n"
         "Step 1/3: Enter number of days\n"
@@ -287,14 +355,16 @@ async def plan_days_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if days <= 0:
             raise ValueError
         context.user_data['plan_days'] = days
-        await update.message.reply_text(
+        await outbox_for(context.bot).call(
+            OWNER,
+            update.message.reply_text,
             f"✅ Days: {days}\n\n"
             "Step 2/3: Enter price in rupees\n"
             "Example: 1, 5, 100"
         )
         return PLAN_PRICE
     except:
-        await update.message.reply_text("❌ Invalid! Enter a positive number:")
+        await outbox_for(context.bot).call(OWNER, update.message.reply_text, "❌ Invalid! Enter a positive number:")
         return PLAN_DAYS
 
 async def plan_price_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -303,17 +373,20 @@ async def plan_price_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if price <= 0:
             raise ValueError
         context.user_data['plan_price'] = price
-        await update.message.reply_text(
+        await outbox_for(context.bot).call(
+            OWNER,
+            update.message.reply_text,
             f"✅ Price: ₹{price}\n\n"
             "Step 3/3: Enter your UPI ID\n"
             "Example: username@upi"
         )
         return PLAN_UPI
     except:
-        await update.message.reply_text("❌ Invalid! Enter a positive number:")
+        await outbox_for(context.bot).call(OWNER, update.message.reply_text, "❌ Invalid! Enter a positive number:")
         return PLAN_PRICE
 
 async def plan_upi_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     upi = update.message.text.strip()
     
     days = context.user_data['plan_days']
@@ -321,7 +394,9 @@ async def plan_upi_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     plan = db.add_plan(days, price, upi)
     
-    await update.message.reply_text(
+    await outbox_for(context.bot).call(
+        OWNER,
+        update.message.reply_text,
         f"✅ Plan Created Successfully!\n\n"
         f"📦 Details:\n"
         f"Days: {plan['days']}\n"
@@ -337,32 +412,34 @@ async def plan_upi_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 async def delete_plan_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     plans = db.get_plans()
     if not plans:
-        await query.message.reply_text("No plans to delete.")
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "No plans to delete.")
         return
     
     text = "➖ Delete Plan\n━━━━━━━━━━━━━━━━\n\nSend plan ID to delete:\n\n"
     for p in plans:
         text += f"ID #{p['id']}: {p['days']} days - ₹{p['price']}\n"
     
-    await query.message.reply_text(text)
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text)
     context.user_data['awaiting_delete_plan'] = True
 
 async def owner_payments_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     pending = db.get_pending_payments()
     
     if not pending:
-        await query.message.reply_text("💳 No pending payments.")
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "💳 No pending payments.")
         return
     
-    await query.message.reply_text(f"💳 Found {len(pending)} pending payment(s):")
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, f"💳 Found {len(pending)} pending payment(s):")
     
     for p in pending:
         user = db.get_user(p['user_id'])
@@ -384,7 +461,9 @@ async def owner_payments_callback(update: Update, context: ContextTypes.DEFAULT_
             ]
         ]
         
-        await context.bot.send_photo(
+        await outbox_for(context.bot).call(
+            OWNER,
+            context.bot.send_photo,
             query.message.chat_id,
             p['screenshot'],
             caption=text,
@@ -392,6 +471,79 @@ async def owner_payments_callback(update: Update, context: ContextTypes.DEFAULT_
             parse_mode='HTML'
         )
 
+async def approve_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
+    query = update.callback_query
+    payment_id = int(query.data.split("_")[1])
+    payment = db.approve_payment(payment_id)
+    
+    if not payment:
+        await query.answer("Payment not found", show_alert=True)
+        return
+    
+    await query.answer("✅ Approved!", show_alert=True)
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.edit_caption,
+        caption=query.message.caption + "\n\n✅ APPROVED - Waiting for bot token"
+    )
+    
+    # Notify user
+    user_id = payment['user_id']
+    await outbox_for(context.bot).call(
+        OWNER,
+        context.bot.send_message,
+        user_id,
+        f"🎉 Payment Approved!\n\n"
+        f"Now send your bot token from @BotFather\n\n"
+        f"Steps:\n"
+        f"1. Go to @BotFather\n"
+        f"2. Create new bot with /newbot\n"
+        f"3. Copy the bot token\n"
+        f"4. Send it here"
+    )
+    
+    # The token arrives in the buyer's chat, so the flag goes in the buyer's user_data
+    context.application.user_data[user_id]['awaiting_token'] = payment['id']
+    # Not the user of this update, so persistence has to be told it changed
+    context.application.mark_data_for_update_persistence(user_ids=user_id)
+    logger.info(f"✅ Payment {payment_id} approved")
+
+async def reject_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
+    query = update.callback_query
+    payment_id = int(query.data.split("_")[1])
+    
+    if not db.reject_payment(payment_id):
+        await query.answer("Payment not found", show_alert=True)
+        return
+    
+    await query.answer("❌ Rejected!", show_alert=True)
+    await outbox_for(context.bot).call(
+        OWNER,
+        query.message.edit_caption,
+        caption=query.message.caption + "\n\n❌ REJECTED"
+    )
+    logger.info(f"❌ Payment {payment_id} rejected")
+
+async def owner_latency_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    rows = context.bot_data['callback_router'].metrics()
+    if not rows:
+        await outbox_for(context.bot).call(OWNER, query.message.reply_text, "⏱ No button presses recorded yet.")
+        return
+    
+    text = "⏱ Panel Latency (slowest first)\n━━━━━━━━━━━━━━━━\n\n"
+    for row in rows[:15]:
+        text += (
+            f"{row['route']}: {row['calls']} calls\n"
+            f"   p50 {row['p50']:.0f}ms · p95 {row['p95']:.0f}ms · p99 {row['p99']:.0f}ms\n"
+        )
+    
+    await outbox_for(context.bot).call(OWNER, query.message.reply_text, text)
+
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("❌ Cancelled. Use /start to go back.")
+    await outbox_for(context.bot).call(OWNER, update.message.reply_text, "❌ Cancelled. Use /start to go back.")
     return ConversationHandler.END
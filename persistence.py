@@ -0,0 +1,75 @@
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+class DatabasePersistence(BasePersistence):
+    """PTB persistence on top of the bot's Database.
+
+    user_data, chat_data and conversation states go into the user_data,
+    chat_data and conversations tables one entry per key, so each change is
+    a single put/delete that the storage backend batches like any other.
+    PTB hands over only the entries touched since the last run, every
+    update_interval seconds. Empty dicts and ended conversations are deleted,
+    so a restart only loads what is still in flight. bot_data holds live
+    objects (router, gates, managers) and is not persisted.
+    """
+
+    def __init__(self, db, update_interval=30):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+
+    async def get_user_data(self):
+        return self.db.load_handler_data('user_data')
+
+    async def get_chat_data(self):
+        return self.db.load_handler_data('chat_data')
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return self.db.load_conversations(name)
+
+    async def update_conversation(self, name, key, new_state):
+        self.db.save_conversation(name, key, new_state)
+
+    async def update_user_data(self, user_id, data):
+        self.db.save_handler_data('user_data', user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self.db.save_handler_data('chat_data', chat_id, data)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self.db.save_handler_data('user_data', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self.db.save_handler_data('chat_data', chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        self.db.flush()
+
+
+def database_persistence(db):
+    return DatabasePersistence(db, update_interval=float(os.getenv('PERSISTENCE_INTERVAL', '30')))
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n=1):
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def delay(self, n=1):
+        """Seconds until n tokens could be taken."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    async def take(self, n=1):
+        while not self.try_take(n):
+            await asyncio.sleep(self.delay(n))
+
+    def pause(self, seconds):
+        """Hand out nothing for `seconds` (e.g. after a RetryAfter)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class KeyedLimiter:
+    """One TokenBucket per key (chat), dropping buckets that have refilled."""
+
+    def __init__(self, rate, burst=None, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def get(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.prune()
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def take(self, key):
+        await self.get(key).take()
+
+    def prune(self):
+        # A full bucket carries no state worth keeping
+        for key in [k for k, b in self.buckets.items() if b.is_full()]:
+            del self.buckets[key]
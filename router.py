@@ -0,0 +1,78 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Route:
+    def __init__(self, name, handler, owner_only, samples=512):
+        self.name = name
+        self.handler = handler
+        self.owner_only = owner_only
+        self.calls = 0
+        self.latencies = deque(maxlen=samples)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class CallbackRouter:
+    """Dispatches callback queries by dict lookup instead of an if/elif chain.
+
+    Exact keys ("owner_stats") are tried first, then the namespace before the
+    first underscore ("approve_" for "approve_12"). Owner-only routes are
+    refused for everybody else, and each route records its call count and
+    recent latencies.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+
+    def route(self, key, handler, owner_only=False):
+        self.exact[key] = Route(key, handler, owner_only)
+
+    def prefix(self, prefix, handler, owner_only=False):
+        self.prefixes[prefix] = Route(prefix + '*', handler, owner_only)
+
+    def resolve(self, data):
+        route = self.exact.get(data)
+        if route is None:
+            head, sep, _ = data.partition('_')
+            route = self.prefixes.get(head + sep)
+        return route
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        route = self.resolve(query.data or '')
+        if route is None:
+            await query.answer()
+            return
+        if route.owner_only and query.from_user.id != context.bot_data.get('OWNER_ID'):
+            await query.answer("⛔️ Owner only", show_alert=True)
+            return
+
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context)
+        finally:
+            route.calls += 1
+            route.latencies.append(time.perf_counter() - started)
+
+    def metrics(self):
+        """Per-route calls and p50/p95/p99 latency in milliseconds, slowest p95 first."""
+        rows = [
+            {
+                'route': r.name,
+                'calls': r.calls,
+                'p50': r.percentile(0.50) * 1000,
+                'p95': r.percentile(0.95) * 1000,
+                'p99': r.percentile(0.99) * 1000
+            }
+            for r in list(self.exact.values()) + list(self.prefixes.values()) if r.calls
+        ]
+        return sorted(rows, key=lambda row: row['p95'], reverse=True)
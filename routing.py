@@ -0,0 +1,151 @@
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RouteSpill:
+    """On-disk home for reply routes that were evicted from memory."""
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS routes (msg_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, ts REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS routes_ts ON routes (ts)')
+        self.prune()
+
+    def put(self, key, user_id, ts):
+        self.conn.execute('INSERT OR REPLACE INTO routes (msg_id, user_id, ts) VALUES (?, ?, ?)', (int(key), user_id, ts))
+
+    def get(self, key):
+        row = self.conn.execute('SELECT user_id FROM routes WHERE msg_id = ?', (int(key),)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, key):
+        self.conn.execute('DELETE FROM routes WHERE msg_id = ?', (int(key),))
+
+    def prune(self):
+        if self.max_age:
+            self.conn.execute('DELETE FROM routes WHERE ts < ?', (time.time() - self.max_age,))
+
+    def close(self):
+        self.conn.close()
+
+
+class RouteStore:
+    """Bounded owner-message -> user map with LRU + TTL eviction.
+
+    `entries` is the message_map dict of the database document: each route is
+    stored as [user_id, last used], so its age survives a restart. The dict is
+    kept in recency order (dicts preserve insertion order), so the oldest
+    route is always first and both the size bound and the TTL evict from the
+    front. Evicted and expired routes go to the optional spill so old replies
+    still resolve; without one they are gone. on_store is called for every
+    route that has to be (re)written.
+    """
+
+    def __init__(self, entries, max_size=50000, ttl=None, spill=None, on_evict=None, on_store=None):
+        self.entries = entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.spill = spill
+        self.on_evict = on_evict
+        self.on_store = on_store
+        now = time.time()
+        # Routes saved before their age was recorded start their TTL now
+        self.upgraded = 0
+        for key, route in entries.items():
+            if not isinstance(route, list):
+                entries[key] = [route, now]
+                self.upgraded += 1
+        # A replayed journal rewrites keys in place, so restore recency order
+        stamps = [route[1] for route in entries.values()]
+        if stamps != sorted(stamps):
+            routes = sorted(entries.items(), key=lambda item: item[1][1])
+            entries.clear()
+            entries.update(routes)
+
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._trim(now)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _evict(self, key, expired):
+        user_id, ts = self.entries.pop(key)
+        if expired:
+            self.expirations += 1
+        else:
+            self.evictions += 1
+        if self.spill is not None:
+            self.spill.put(key, user_id, ts)
+        if self.on_evict:
+            self.on_evict(key)
+
+    def _trim(self, now):
+        if self.ttl:
+            cutoff = now - self.ttl
+            while self.entries:
+                key = next(iter(self.entries))
+                if self.entries[key][1] >= cutoff:
+                    break
+                self._evict(key, expired=True)
+        while len(self.entries) > self.max_size:
+            self._evict(next(iter(self.entries)), expired=False)
+
+    def put(self, key, user_id):
+        now = time.time()
+        self.entries.pop(key, None)
+        route = self.entries[key] = [user_id, now]
+        if self.on_store:
+            self.on_store(key, route)
+        self._trim(now)
+
+    def get(self, key):
+        """Return the user a reply to owner message `key` goes to, or None."""
+        route = self.entries.get(key)
+        if route is not None:
+            if self.ttl and route[1] < time.time() - self.ttl:
+                self._evict(key, expired=True)
+            else:
+                self.hits += 1
+                # Move to the back: most recently used
+                self.put(key, route[0])
+                return route[0]
+
+        if self.spill is not None:
+            user_id = self.spill.get(key)
+            if user_id is not None:
+                self.spill_hits += 1
+                self.spill.delete(key)
+                self.put(key, user_id)
+                return user_id
+
+        self.misses += 1
+        return None
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'spill_hits': self.spill_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
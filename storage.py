@@ -0,0 +1,423 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Tables whose records live in a list on the in-memory document, keyed by 'id'
+LIST_TABLES = ('plans', 'pending_payments')
+
+
+class Storage:
+    """Persistence backend behind Database.
+
+    Database keeps the whole document in memory and reports every change as a
+    single-record put/delete, so a backend only has to write what changed.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, data):
+        raise NotImplementedError
+
+    def put(self, table, key, value):
+        raise NotImplementedError
+
+    def delete(self, table, key):
+        raise NotImplementedError
+
+    def start(self, loop=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+def write_atomic(path, payload):
+    """Write to a temp file and rename it over path, so a kill never leaves half a file."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class JsonStorage(Storage):
+    """The data.json snapshot, written behind the handlers.
+
+    Changes only mark the document dirty. Once start() has attached an event
+    loop, one snapshot is taken per flush_interval seconds (or as soon as
+    flush_every changes pile up) and written off-loop via temp file + rename.
+    flush_interval=0 writes every change through, as before.
+    """
+
+    def __init__(self, path, flush_interval=2.0, flush_every=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.data = None
+        self.dirty = 0
+        self.loop = None
+        self._timer = None
+        self._writer = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            self.data = json.load(f)
+        return self.data
+
+    def save(self, data):
+        self.data = data
+        self.dirty = 0
+        write_atomic(self.path, json.dumps(data, separators=(',', ':')))
+
+    def start(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-flush')
+        if self.dirty:
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = self.loop.call_later(self.flush_interval, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def _mark_dirty(self):
+        self.dirty += 1
+        if self.flush_interval <= 0 or self.dirty >= self.flush_every:
+            self.flush()
+        elif self.loop is not None:
+            self._schedule()
+
+    def put(self, table, key, value):
+        self._mark_dirty()
+
+    def delete(self, table, key):
+        self._mark_dirty()
+
+    def flush(self):
+        if not self.dirty or self.data is None:
+            return
+        # Serialize on the caller's thread so the snapshot is consistent
+        payload = json.dumps(self.data, separators=(',', ':'))
+        self.dirty = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writer is not None:
+            self._writer.submit(write_atomic, self.path, payload)
+        else:
+            write_atomic(self.path, payload)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        self.loop = None
+
+
+def apply_change(data, op, table, key, value=None):
+    """Apply one put/delete to the in-memory document (used to replay a journal)."""
+    if table == 'banned':
+        banned = data.setdefault('banned', [])
+        if op == 'put' and key not in banned:
+            banned.append(key)
+        elif op == 'del' and key in banned:
+            banned.remove(key)
+    elif table in LIST_TABLES:
+        items = [i for i in data.get(table, []) if i['id'] != key]
+        if op == 'put':
+            items.append(value)
+            items.sort(key=lambda i: i['id'])
+        data[table] = items
+    elif op == 'put':
+        data.setdefault(table, {})[key] = value
+    else:
+        data.get(table, {}).pop(key, None)
+
+
+class JournalStorage(Storage):
+    """A data.json snapshot plus an append-only log of changes (data.json.log).
+
+    Each change appends one compact JSON line, so a write costs the size of the
+    record. Loading replays the log over the snapshot; once the log passes
+    max_log_bytes it is folded into a fresh snapshot and truncated.
+    """
+
+    def __init__(self, path, max_log_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.log_path = path + '.log'
+        self.max_log_bytes = max_log_bytes
+        self.data = None
+        self.log = None
+
+    def load(self):
+        data = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+
+        replayed = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        logger.warning(f"⚠️ Skipping damaged journal entry in {self.log_path}")
+                        continue
+                    if data is None:
+                        data = {}
+                    apply_change(data, entry['op'], entry['t'], entry['k'], entry.get('v'))
+                    replayed += 1
+        if replayed:
+            logger.info(f"📜 Replayed {replayed} journal entries from {self.log_path}")
+
+        self.data = data
+        self._open_log()
+        return data
+
+    def _open_log(self):
+        if self.log is None:
+            self.log = open(self.log_path, 'a', buffering=1)
+
+    def _append(self, entry):
+        self._open_log()
+        self.log.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        if self.log.tell() >= self.max_log_bytes:
+            self.compact()
+
+    def put(self, table, key, value):
+        self._append({'op': 'put', 't': table, 'k': key, 'v': value})
+
+    def delete(self, table, key):
+        self._append({'op': 'del', 't': table, 'k': key})
+
+    def save(self, data):
+        self.data = data
+        self.compact()
+
+    def compact(self):
+        """Fold the log into a new snapshot, then start an empty log."""
+        if self.data is None:
+            return
+        write_atomic(self.path, json.dumps(self.data, separators=(',', ':')))
+        # Replaying the old log over the new snapshot is harmless, so a crash
+        # between the rename and the truncate loses nothing
+        if self.log is not None:
+            self.log.close()
+        self.log = open(self.log_path, 'w', buffering=1)
+        logger.info(f"🗜 Compacted journal into {self.path}")
+
+    def flush(self):
+        if self.log is not None:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+
+    def close(self):
+        if self.log is not None:
+            self.flush()
+            self.log.close()
+            self.log = None
+
+
+class SqliteStorage(Storage):
+    """One row per record in indexed tables, so a write never touches the rest."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS banned (id INTEGER PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS plans (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY, user_id INTEGER, status TEXT, data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS payments_status ON payments (status);
+        CREATE TABLE IF NOT EXISTS clones (
+            user_id INTEGER PRIMARY KEY, active INTEGER, expiry TEXT, data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS clones_expiry ON clones (active, expiry);
+        CREATE TABLE IF NOT EXISTS message_map (msg_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, ts REAL);
+        CREATE TABLE IF NOT EXISTS kv (
+            tbl TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (tbl, key)
+        );
+    """
+
+    # table -> (upsert sql, row builder, delete sql)
+    ROWS = {
+        'users': (
+            'INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)',
+            lambda k, v: (int(k), json.dumps(v)),
+            'DELETE FROM users WHERE id = ?'
+        ),
+        'banned': (
+            'INSERT OR IGNORE INTO banned (id) VALUES (?)',
+            lambda k, v: (int(k),),
+            'DELETE FROM banned WHERE id = ?'
+        ),
+        'plans': (
+            'INSERT OR REPLACE INTO plans (id, data) VALUES (?, ?)',
+            lambda k, v: (int(k), json.dumps(v)),
+            'DELETE FROM plans WHERE id = ?'
+        ),
+        'pending_payments': (
+            'INSERT OR REPLACE INTO payments (id, user_id, status, data) VALUES (?, ?, ?, ?)',
+            lambda k, v: (int(k), v.get('user_id'), v.get('status'), json.dumps(v)),
+            'DELETE FROM payments WHERE id = ?'
+        ),
+        'cloned_bots': (
+            'INSERT OR REPLACE INTO clones (user_id, active, expiry, data) VALUES (?, ?, ?, ?)',
+            lambda k, v: (int(k), int(bool(v.get('active'))), v.get('expiry'), json.dumps(v)),
+            'DELETE FROM clones WHERE user_id = ?'
+        ),
+        'message_map': (
+            'INSERT OR REPLACE INTO message_map (msg_id, user_id, ts) VALUES (?, ?, ?)',
+            lambda k, v: (int(k), *v) if isinstance(v, list) else (int(k), v, None),
+            'DELETE FROM message_map WHERE msg_id = ?'
+        ),
+    }
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        # Databases created before routes recorded their age
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(message_map)')]
+        if 'ts' not in columns:
+            self.conn.execute('ALTER TABLE message_map ADD COLUMN ts REAL')
+
+    def _is_empty(self):
+        for table in ('users', 'plans', 'payments', 'clones', 'kv'):
+            if self.conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                return False
+        return True
+
+    def load(self):
+        if self._is_empty():
+            if self.json_path and os.path.exists(self.json_path):
+                migrate_json_to_sqlite(self.json_path, self)
+            else:
+                return None
+
+        c = self.conn
+        data = {
+            'users': {str(i): json.loads(d) for i, d in c.execute('SELECT id, data FROM users ORDER BY rowid')},
+            'banned': [i for (i,) in c.execute('SELECT id FROM banned ORDER BY rowid')],
+            'plans': [json.loads(d) for (d,) in c.execute('SELECT data FROM plans ORDER BY id')],
+            'pending_payments': [json.loads(d) for (d,) in c.execute('SELECT data FROM payments ORDER BY id')],
+            'cloned_bots': {str(i): json.loads(d) for i, d in c.execute('SELECT user_id, data FROM clones ORDER BY rowid')},
+            'message_map': {
+                str(m): u if ts is None else [u, ts]
+                for m, u, ts in c.execute('SELECT msg_id, user_id, ts FROM message_map ORDER BY rowid')
+            },
+        }
+        for tbl, key, value in c.execute('SELECT tbl, key, value FROM kv ORDER BY rowid'):
+            if tbl == '_doc':
+                data[key] = json.loads(value)
+            else:
+                data.setdefault(tbl, {})[key] = json.loads(value)
+        return data
+
+    def save(self, data):
+        c = self.conn
+        c.execute('BEGIN')
+        try:
+            for table in ('users', 'banned', 'plans', 'payments', 'clones', 'message_map', 'kv'):
+                c.execute(f'DELETE FROM {table}')
+            for table, value in data.items():
+                if table == 'banned':
+                    rows = ((uid, True) for uid in value)
+                elif table in LIST_TABLES:
+                    rows = ((item['id'], item) for item in value)
+                elif table in self.ROWS or isinstance(value, dict):
+                    rows = value.items()
+                else:
+                    c.execute('INSERT INTO kv (tbl, key, value) VALUES (?, ?, ?)', ('_doc', table, json.dumps(value)))
+                    continue
+                for key, item in rows:
+                    self._put(table, key, item)
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+
+    def _put(self, table, key, value):
+        if table in self.ROWS:
+            sql, row, _ = self.ROWS[table]
+            self.conn.execute(sql, row(key, value))
+        else:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO kv (tbl, key, value) VALUES (?, ?, ?)',
+                (table, str(key), json.dumps(value))
+            )
+
+    def put(self, table, key, value):
+        self._put(table, key, value)
+
+    def delete(self, table, key):
+        if table in self.ROWS:
+            self.conn.execute(self.ROWS[table][2], (int(key),))
+        else:
+            self.conn.execute('DELETE FROM kv WHERE tbl = ? AND key = ?', (table, str(key)))
+
+    def close(self):
+        self.conn.close()
+
+
+def migrate_json_to_sqlite(json_path, target):
+    """Copy an existing data.json into a SQLite store (path or SqliteStorage)."""
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+
+    store = target if isinstance(target, SqliteStorage) else SqliteStorage(target)
+    store.save(data)
+    logger.info(
+        f"📦 Migrated {json_path} into {store.path}: "
+        f"{len(data.get('users', {}))} users, {len(data.get('message_map', {}))} mapped messages"
+    )
+    return store
+
+
+def open_storage(backend, path):
+    """Build the storage backend named by DB_BACKEND for the given data file."""
+    if backend == 'json':
+        return JsonStorage(
+            path,
+            flush_interval=float(os.getenv('DB_FLUSH_INTERVAL', '2')),
+            flush_every=int(os.getenv('DB_FLUSH_EVERY', '500'))
+        )
+    if backend == 'journal':
+        return JournalStorage(path, max_log_bytes=int(os.getenv('DB_JOURNAL_MAX_BYTES', str(4 * 1024 * 1024))))
+    if backend == 'sqlite':
+        base, ext = os.path.splitext(path)
+        if ext == '.json':
+            return SqliteStorage(base + '.db', json_path=path)
+        return SqliteStorage(path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == '__main__':
+    # python storage.py migrate data.json data.db
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print("Usage: python storage.py migrate <data.json> <data.db>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    migrate_json_to_sqlite(sys.argv[2], sys.argv[3]).close()
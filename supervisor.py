@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+
+from clones import clone_manager
+from handlers import post_init, post_shutdown, setup_bot
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(user_id, shards):
+    """Stable shard of a clone: the same buyer lands on the same worker across restarts."""
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+class ShardSupervisor:
+    """Spreads the clone bots over worker processes; bot.py stays the control plane.
+
+    Each clone belongs to shard crc32(buyer id) % shards, so adding or
+    expiring a clone only touches its own worker and nothing is reshuffled.
+    Workers run a CloneManager on their own event loop and never write the
+    main database: they get (buyer id, token, owner name) over a pipe and
+    report back which clones started and how loaded they are. A worker that
+    dies is restarted with its clones. Same interface as CloneManager.
+    """
+
+    def __init__(self, db, shards, check_interval=5.0):
+        self.db = db
+        self.shards = shards
+        self.check_interval = check_interval
+        self.ctx = multiprocessing.get_context('spawn')
+        self.loop = None
+        self.monitor = None
+        # shard -> (process, connection)
+        self.workers = [None] * shards
+        self.restarts = [0] * shards
+        self.load = [{} for _ in range(shards)]
+        # buyer id -> (token, owner name), the desired state
+        self.assigned = {}
+        self.running = {}
+        self.failed = {}
+        self.requests = itertools.count(1)
+        self.pending = {}
+
+    def username(self, user_id):
+        return self.running.get(user_id)
+
+    async def start_all(self):
+        self.loop = asyncio.get_running_loop()
+        for uid, clone in self.db.get_active_clones().items():
+            owner = self.db.get_user(int(uid))
+            self.assigned[int(uid)] = (clone['bot_token'], owner['name'] if owner else 'Owner')
+        for shard in range(self.shards):
+            self._spawn(shard)
+        self.monitor = asyncio.create_task(self._watch())
+        logger.info(f"🧩 {len(self.assigned)} clone bots spread over {self.shards} worker processes")
+
+    def _spawn(self, shard):
+        conn, child = self.ctx.Pipe()
+        clones = [(uid, token, name) for uid, (token, name) in self.assigned.items()
+                  if shard_of(uid, self.shards) == shard]
+        process = self.ctx.Process(target=run_worker, args=(shard, child, clones), name=f'clone-shard-{shard}', daemon=True)
+        process.start()
+        child.close()
+        self.workers[shard] = (process, conn)
+        self.loop.add_reader(conn.fileno(), self._on_message, shard, conn)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for shard, (process, conn) in enumerate(self.workers):
+                if process.is_alive():
+                    continue
+                logger.error(f"💥 Clone shard {shard} died (exit code {process.exitcode}), restarting")
+                self._drop(shard, conn)
+                self.restarts[shard] += 1
+                self._spawn(shard)
+
+    def _drop(self, shard, conn):
+        self.loop.remove_reader(conn.fileno())
+        conn.close()
+        for uid in [uid for uid in self.running if shard_of(uid, self.shards) == shard]:
+            del self.running[uid]
+        self.load[shard] = {}
+        for request, (owner, future) in list(self.pending.items()):
+            if owner == shard:
+                del self.pending[request]
+                future.set_exception(RuntimeError(f"clone shard {shard} stopped"))
+
+    def _on_message(self, shard, conn):
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # Worker gone; the watcher restarts it
+            self.loop.remove_reader(conn.fileno())
+            return
+
+        kind = message[0]
+        if kind == 'load':
+            self.load[shard] = message[1]
+            return
+
+        _, request, uid, result = message
+        if kind == 'started':
+            self.running[uid] = result
+            self.failed.pop(uid, None)
+        else:
+            self.running.pop(uid, None)
+            self.failed[uid] = result
+            logger.error(f"❌ Clone of user {uid} failed to start on shard {shard}: {result}")
+
+        _, future = self.pending.pop(request, (None, None))
+        if future is not None and not future.done():
+            if kind == 'started':
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _send(self, user_id, *command):
+        # A dead worker is restarted from self.assigned, so a lost command is not lost state
+        _, conn = self.workers[shard_of(user_id, self.shards)]
+        try:
+            conn.send(command)
+            return True
+        except OSError:
+            return False
+
+    async def start(self, user_id, token, owner_name):
+        """Start (or restart with a new token) the clone of user_id on its shard; returns its @username."""
+        shard = shard_of(user_id, self.shards)
+        request = next(self.requests)
+        future = self.loop.create_future()
+        self.pending[request] = (shard, future)
+        if not self._send(user_id, 'start', request, user_id, token, owner_name):
+            del self.pending[request]
+            raise RuntimeError(f"clone shard {shard} is restarting")
+        username = await future
+        self.assigned[user_id] = (token, owner_name)
+        return username
+
+    async def stop(self, user_id):
+        self.assigned.pop(user_id, None)
+        self.running.pop(user_id, None)
+        self._send(user_id, 'stop', user_id)
+
+    async def stop_many(self, user_ids):
+        for uid in user_ids:
+            await self.stop(uid)
+
+    async def stop_all(self):
+        if self.loop is None:
+            return
+        if self.monitor is not None:
+            self.monitor.cancel()
+        for _, conn in self.workers:
+            try:
+                conn.send(('exit',))
+            except OSError:
+                pass
+        for shard, (process, conn) in enumerate(self.workers):
+            await self.loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                process.terminate()
+            self._drop(shard, conn)
+
+    def stats(self):
+        return {
+            'running': sum(load.get('running', 0) for load in self.load),
+            'sleeping': sum(load.get('sleeping', 0) for load in self.load),
+            'failed': len(self.failed),
+            'shards': [
+                dict(self.load[shard], shard=shard, restarts=self.restarts[shard])
+                for shard in range(self.shards)
+            ]
+        }
+
+
+def run_worker(shard, conn, clones):
+    """Entry point of a shard process: runs `clones` [(buyer id, token, owner name)] and obeys conn."""
+    logging.basicConfig(
+        format=f'%(asctime)s - shard {shard} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        # Spawn already ran bot.py's basicConfig when it re-imported the main module
+        force=True
+    )
+    asyncio.run(_serve(shard, conn, clones))
+
+
+async def _serve(shard, conn, clones):
+    manager = clone_manager(None, setup_bot, post_init=post_init, post_shutdown=post_shutdown)
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+    tasks = set()
+    gate = asyncio.Semaphore(10)
+
+    def spawn(coro):
+        task = loop.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def start(request, uid, token, name):
+        async with gate:
+            try:
+                conn.send(('started', request, uid, await manager.start(uid, token, name)))
+            except Exception as e:
+                conn.send(('failed', request, uid, str(e)))
+
+    def on_command():
+        try:
+            command = conn.recv()
+        except (EOFError, OSError):
+            # Supervisor is gone
+            done.set()
+            return
+        if command[0] == 'start':
+            spawn(start(*command[1:]))
+        elif command[0] == 'stop':
+            spawn(manager.stop(command[1]))
+        elif command[0] == 'exit':
+            done.set()
+
+    async def report():
+        wall, cpu = time.monotonic(), time.process_time()
+        while True:
+            await asyncio.sleep(5)
+            now_wall, now_cpu = time.monotonic(), time.process_time()
+            stats = manager.stats()
+            stats['cpu'] = round(100 * (now_cpu - cpu) / (now_wall - wall))
+            wall, cpu = now_wall, now_cpu
+            conn.send(('load', stats))
+
+    loop.add_reader(conn.fileno(), on_command)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, done.set)
+    for uid, token, name in clones:
+        spawn(start(None, uid, token, name))
+    spawn(report())
+
+    await done.wait()
+    loop.remove_reader(conn.fileno())
+    await manager.stop_all()
@@ -0,0 +1,78 @@
+import logging
+import os
+from collections import OrderedDict
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class TenantRegistry:
+    """One Database per clone bot, in its own tenants/<bot id>/ directory.
+
+    A running clone holds its tenant with acquire() and gives it back with
+    release(). Released tenants stay open in LRU order, so a clone waking
+    from hibernation finds its data still loaded; past max_idle of them the
+    least recently used is flushed and closed and its memory goes with it.
+    Tenants never share a file, so a write for one clone only ever
+    re-serializes that clone's data.
+    """
+
+    def __init__(self, root='tenants', max_idle=32):
+        self.root = root
+        self.max_idle = max_idle
+        # bot id -> [Database, holders]
+        self.active = {}
+        # bot id -> Database, least recently released first
+        self.idle = OrderedDict()
+
+    def path(self, bot_id):
+        return os.path.join(self.root, str(bot_id), 'data.json')
+
+    def acquire(self, bot_id):
+        entry = self.active.get(bot_id)
+        if entry is None:
+            database = self.idle.pop(bot_id, None)
+            if database is None:
+                database = self._open(bot_id)
+            entry = self.active[bot_id] = [database, 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, bot_id):
+        entry = self.active.get(bot_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self.active[bot_id]
+        self.idle[bot_id] = entry[0]
+        while len(self.idle) > self.max_idle:
+            evicted, database = self.idle.popitem(last=False)
+            database.close()
+            logger.info(f"🗄 Closed idle tenant {evicted}")
+
+    def _open(self, bot_id):
+        os.makedirs(os.path.dirname(self.path(bot_id)), exist_ok=True)
+        database = Database(file=self.path(bot_id))
+        # Opened from a handler or startup hook, so an event loop is running
+        database.start()
+        return database
+
+    def close_all(self):
+        for database, _ in self.active.values():
+            database.close()
+        for database in self.idle.values():
+            database.close()
+        self.active.clear()
+        self.idle.clear()
+
+    def stats(self):
+        return {'active': len(self.active), 'idle': len(self.idle)}
+
+
+tenants = TenantRegistry(
+    root=os.getenv('TENANT_DIR', 'tenants'),
+    max_idle=int(os.getenv('TENANT_MAX_IDLE', '32'))
+)
@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram import InputMediaDocument, InputMediaPhoto
+
+from albums import AlbumCollector, build_media, describe
+
+
+def part(message_id, group='g1', **media):
+    fields = dict(photo=None, video=None, document=None, audio=None, caption=None, caption_html=None)
+    fields.update(media)
+    return SimpleNamespace(message_id=message_id, media_group_id=group, **fields)
+
+
+def test_collects_a_group_in_message_order():
+    collector = AlbumCollector(delay=0.05)
+    done = []
+
+    async def on_complete(messages):
+        done.append([m.message_id for m in messages])
+
+    async def run():
+        collector.start(part(2), on_complete)
+        await asyncio.sleep(0.03)
+        # Each part restarts the quiet period
+        assert collector.join(part(1))
+        await asyncio.sleep(0.03)
+        assert collector.join(part(3))
+        assert not collector.join(part(4, group='g2'))
+        assert not collector.join(part(5, group=None))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert done == [[1, 2, 3]]
+    assert collector.groups == {} and collector.tasks == set()
+
+
+def test_failing_handler_does_not_leak_the_group():
+    collector = AlbumCollector(delay=0.01)
+
+    async def on_complete(messages):
+        raise RuntimeError('boom')
+
+    async def run():
+        collector.start(part(1), on_complete)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert collector.groups == {} and collector.tasks == set()
+
+
+def test_describe_and_build_media():
+    photo = part(1, photo=[SimpleNamespace(file_id='small'), SimpleNamespace(file_id='large')],
+                 caption='hi', caption_html='<b>hi</b>')
+    doc = part(2, document=SimpleNamespace(file_id='doc'))
+    items = [describe(photo), describe(doc)]
+
+    assert items == [
+        {'type': 'photo', 'file_id': 'large', 'caption': '<b>hi</b>'},
+        {'type': 'document', 'file_id': 'doc', 'caption': None},
+    ]
+    assert describe(part(3)) is None
+
+    media = build_media(items, first_caption='From @ann')
+    assert [type(m) for m in media] == [InputMediaPhoto, InputMediaDocument]
+    assert [m.caption for m in media] == ['From @ann', None]
+    assert build_media(items)[0].caption == '<b>hi</b>'
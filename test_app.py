@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+from telegram import Update
+from telegram.ext import Application
+
+import app
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'update.json')
+SECRET = 'test-secret'
+
+
+@pytest.fixture
+def recorded_update():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, 'WEBHOOK_SECRET', SECRET)
+    return app.app.test_client()
+
+
+@pytest.fixture
+def attached(monkeypatch):
+    """A real Application whose loop runs in a background thread, like bot.py's."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    application = asyncio.run_coroutine_threadsafe(_build(), loop).result(timeout=5)
+    monkeypatch.setattr(app, 'bot_app', None)
+    monkeypatch.setattr(app, 'bot_loop', None)
+    app.attach_bot(application, loop)
+    yield application, loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+async def _build():
+    # Built on the bot loop so the update queue belongs to it
+    return Application.builder().token('123456:' + 'a' * 35).updater(None).build()
+
+
+def post(client, payload, secret=SECRET):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret is not None else {}
+    return client.post(app.WEBHOOK_PATH, json=payload, headers=headers)
+
+
+def test_recorded_update_is_queued(client, attached, recorded_update):
+    application, loop = attached
+    response = post(client, recorded_update)
+    assert response.status_code == 200
+
+    queued = asyncio.wait_for(application.update_queue.get(), 5)
+    update = asyncio.run_coroutine_threadsafe(queued, loop).result(timeout=5)
+    assert isinstance(update, Update)
+    assert update.update_id == recorded_update['update_id']
+    assert update.effective_user.id == 100200300
+    assert update.message.text == 'Hello there'
+    assert update.get_bot() is application.bot
+
+
+@pytest.mark.parametrize('secret', ['wrong', '', None])
+def test_secret_is_enforced(client, attached, recorded_update, secret):
+    application, _ = attached
+    assert post(client, recorded_update, secret=secret).status_code == 403
+    assert application.update_queue.empty()
+
+
+def test_missing_server_secret_refuses_everything(client, attached, recorded_update, monkeypatch):
+    monkeypatch.setattr(app, 'WEBHOOK_SECRET', '')
+    assert post(client, recorded_update, secret='').status_code == 403
+
+
+@pytest.mark.parametrize('body', ['not json', '[1]', '"x"', '{}', '{"update_id": "x", "message": 5}'])
+def test_bad_body_is_rejected(client, attached, body):
+    application, _ = attached
+    response = client.post(app.WEBHOOK_PATH, data=body,
+                           headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+    assert response.status_code == 400
+    assert application.update_queue.empty()
+
+
+def test_webhook_off_without_a_bot(client, monkeypatch, recorded_update):
+    monkeypatch.setattr(app, 'bot_app', None)
+    assert post(client, recorded_update).status_code == 503
@@ -0,0 +1,137 @@
+import asyncio
+
+from telegram.error import Forbidden, TimedOut
+
+from broadcast import BroadcastEngine, BroadcastManager
+from database import Database
+from delivery import DELIVERED, UNREACHABLE
+
+
+def test_engine_retries_transient_errors():
+    attempts = {}
+    outcomes = {}
+
+    async def send(chat_id):
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if chat_id == 2 and attempts[chat_id] < 3:
+            raise TimedOut()
+        if chat_id == 3:
+            raise Forbidden("bot was blocked by the user")
+        if chat_id == 4:
+            raise TimedOut()
+
+    engine = BroadcastEngine(rate=1000, concurrency=4)
+    success, failed = asyncio.run(engine.run([1, 2, 3, 4], send, on_result=outcomes.__setitem__))
+
+    assert (success, failed) == (2, 2)
+    assert attempts == {1: 1, 2: 3, 3: 1, 4: 3}
+    assert outcomes[1] == outcomes[2] == DELIVERED
+    assert outcomes[3] == UNREACHABLE
+
+
+def test_engine_stops_when_asked():
+    sent = []
+
+    async def send(chat_id):
+        sent.append(chat_id)
+        await asyncio.sleep(0)
+
+    engine = BroadcastEngine(rate=1000, concurrency=1)
+    asyncio.run(engine.run(range(10), send, should_stop=lambda: len(sent) >= 3))
+    assert sent == [0, 1, 2]
+
+
+class FakeBot:
+    def __init__(self, token, hang_on=None):
+        self.token = token
+        self.hang_on = hang_on
+        self.sent = []
+        self.edits = []
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        if chat_id == self.hang_on:
+            await asyncio.Event().wait()
+        await asyncio.sleep(0.01)
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.edits.append(text)
+
+
+async def finish(manager):
+    while manager.tasks:
+        await asyncio.sleep(0.01)
+
+
+def test_job_resumes_from_last_checkpoint(tmp_path):
+    path = str(tmp_path / 'data.json')
+    targets = list(range(100, 110))
+
+    async def run():
+        # The journal backend writes each checkpoint at once, like a crash would leave it
+        db = Database(file=path, backend='journal')
+        crashed = FakeBot('broadcast-crash', hang_on=104)
+        manager = BroadcastManager(db, BroadcastEngine(rate=1000, concurrency=1), checkpoint_every=2)
+        job = manager.create(1, 1, targets, 1, 1)
+        manager.start(crashed, job)
+        while len(crashed.sent) < 4:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+        restarted = Database(file=path, backend='journal')
+        bot = FakeBot('broadcast-resume')
+        manager2 = BroadcastManager(restarted, BroadcastEngine(rate=1000, concurrency=1))
+        assert manager2.resume_all(bot) == 1
+        await finish(manager2)
+
+        for task in manager.tasks.values():
+            task.cancel()
+        return restarted.get_broadcast(job['id']), bot.sent
+
+    job, resent = asyncio.run(run())
+    assert resent == targets[4:]
+    assert job['state'] == 'done'
+    assert (job['sent_count'], job['cursor'], job['sent']) == (10, 10, [])
+
+
+def test_resume_right_after_pause(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    bot = FakeBot('broadcast-pause')
+    manager = BroadcastManager(db, BroadcastEngine(rate=1000, concurrency=3))
+
+    async def run():
+        job = manager.create(1, 1, list(range(30)), 1, 1)
+        manager.start(bot, job)
+        await asyncio.sleep(0.02)
+        manager.pause(job['id'])
+        # The paused run is still settling its in-flight sends
+        assert job['id'] in manager.tasks
+        await manager.resume(bot, job['id'])
+        assert job['state'] == 'running'
+        await finish(manager)
+        return job
+
+    job = asyncio.run(run())
+    assert job['state'] == 'done'
+    assert sorted(bot.sent) == list(range(30))
+
+
+def test_cancel_paused_job(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    bot = FakeBot('broadcast-cancel')
+    manager = BroadcastManager(db, BroadcastEngine(rate=1000, concurrency=1))
+
+    async def run():
+        job = manager.create(1, 1, list(range(30)), 1, 1)
+        manager.start(bot, job)
+        await asyncio.sleep(0.03)
+        manager.pause(job['id'])
+        await finish(manager)
+        await manager.cancel(bot, job['id'])
+        return job
+
+    job = asyncio.run(run())
+    assert job['state'] == 'cancelled'
+    assert len(bot.sent) < 30
+    assert 'cancelled' in bot.edits[-1]
+    assert db.get_broadcast_targets(job['id']) == []
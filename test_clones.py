@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden, InvalidToken
+from telegram.ext import ExtBot
+
+import clones
+import flood
+import outbox
+from clones import CloneManager
+from database import Database
+from flood import flood_guard_for
+from handlers import report_failed_reply
+from outbox import outbox_for
+from tenants import TenantRegistry
+
+TOKENS = {uid: f'{uid}0000:' + 'a' * 35 for uid in (1, 2, 3)}
+
+
+class SleepingBot:
+    """Stands in for the bare Bot a hibernated clone keeps: answers getUpdates from `pending`."""
+
+    pending = {}
+    revoked = set()
+
+    def __init__(self, token, request=None, get_updates_request=None):
+        self.token = token
+
+    async def get_updates(self, limit, timeout):
+        if self.token in SleepingBot.revoked:
+            raise InvalidToken()
+        return SleepingBot.pending.get(self.token, [])
+
+
+class FakeApp:
+    def __init__(self, token, owner_name, tenant):
+        self.bot = SimpleNamespace(token=token, username=f'clone{token[:5]}')
+        self.bot_data = {'OWNER_NAME': owner_name, 'TENANT': tenant, 'broadcasts': SimpleNamespace(tasks={})}
+        self.updater = SimpleNamespace(running=False)
+        self.running = False
+        self.shut_down = False
+
+    async def shutdown(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(clones, 'Bot', SleepingBot)
+    SleepingBot.pending = {}
+    SleepingBot.revoked = set()
+    manager = CloneManager(None, setup=None, tenants=TenantRegistry(root=str(tmp_path)), wake_rate=1000)
+    launched = []
+
+    async def launch(user_id, token, owner_name):
+        bot_id = int(token.split(':')[0])
+        manager.tenants.acquire(bot_id)
+        launched.append(user_id)
+        return FakeApp(token, owner_name, bot_id)
+
+    manager._launch = launch
+    manager.launched = launched
+    return manager
+
+
+async def check_sleepers(manager, seconds=0.05):
+    task = asyncio.create_task(manager._check_sleepers())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_busy_clone_is_not_hibernated(manager):
+    async def run():
+        await manager.start(1, TOKENS[1], 'Ann')
+        manager.apps[1].bot_data['broadcasts'].tasks[7] = object()
+        await manager._hibernate(1)
+        assert 1 in manager.apps
+
+        manager.apps[1].bot_data['broadcasts'].tasks.clear()
+        app = manager.apps[1]
+        await manager._hibernate(1)
+        return app
+
+    app = asyncio.run(run())
+    assert app.shut_down and manager.apps == {}
+    assert manager.username(1) == 'clone10000'
+    assert manager.tenants.stats() == {'active': 0, 'idle': 1}
+
+
+def test_sleeping_clones_wake_on_pending_updates(manager):
+    async def run():
+        for uid in (1, 2, 3):
+            await manager.start(uid, TOKENS[uid], 'Owner')
+            await manager._hibernate(uid)
+        SleepingBot.pending[TOKENS[1]] = [object()]
+        SleepingBot.revoked.add(TOKENS[2])
+        await check_sleepers(manager)
+
+    asyncio.run(run())
+    assert list(manager.apps) == [1]
+    assert manager.launched == [1, 2, 3, 1] and manager.wakeups == 1
+    # Nothing pending: still asleep; revoked: dropped from the rotation
+    assert list(manager.sleeping) == [3]
+    assert 2 in manager.failed
+
+
+def test_failed_start_releases_the_tenant(tmp_path, monkeypatch):
+    async def rejected(self, *args, **kwargs):
+        raise InvalidToken()
+
+    monkeypatch.setattr(ExtBot, 'get_me', rejected)
+    setups = []
+    manager = CloneManager(None, setup=lambda app, *args, **kwargs: setups.append(args),
+                           tenants=TenantRegistry(root=str(tmp_path)))
+
+    async def run():
+        with pytest.raises(InvalidToken):
+            await manager.start(1, TOKENS[1], 'Ann')
+        await manager.stop_all()
+
+    asyncio.run(run())
+    assert [args[:2] for args in setups] == [(1, 'Ann')]
+    assert manager.apps == {} and manager.tenants.stats() == {'active': 0, 'idle': 0}
+
+
+def test_stop_releases_outbox_flood_guard_and_tenant(manager):
+    async def run():
+        await manager.start(1, TOKENS[1], 'Ann')
+        bot = manager.apps[1].bot
+        outbox_for(bot)
+        flood_guard_for(bot)
+        await manager.stop(1)
+
+    asyncio.run(run())
+    assert TOKENS[1] not in outbox._outboxes and TOKENS[1] not in flood._guards
+    assert manager.apps == {} and manager.tenants.stats() == {'active': 0, 'idle': 1}
+
+
+def test_unreachable_reply_target_is_marked_in_the_replying_bot(tmp_path):
+    main = Database(file=str(tmp_path / 'main.json'))
+    clone = Database(file=str(tmp_path / 'clone.json'))
+    for db in (main, clone):
+        db.add_user(5, 'ann', 'Ann')
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    context = SimpleNamespace(bot=SimpleNamespace(token='unreachable-test'), bot_data={'db': clone})
+    msg = SimpleNamespace(reply_text=reply_text)
+    asyncio.run(report_failed_reply(context, msg, 5, Forbidden("bot was blocked by the user")))
+
+    assert set(clone.get_active_users()) == set()
+    assert set(main.get_active_users()) == {'5'}
+    assert 'unreachable' in replies[0]
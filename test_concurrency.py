@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+from concurrency import PerChatUpdateProcessor
+
+
+def update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_chat_order_kept_while_chats_overlap():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=8)
+    events = []
+
+    async def handle(name, delay):
+        events.append(('start', name))
+        await asyncio.sleep(delay)
+        events.append(('end', name))
+
+    async def run():
+        await asyncio.gather(
+            processor.process_update(update(1), handle('a1', 0.05)),
+            processor.process_update(update(1), handle('a2', 0)),
+            processor.process_update(update(2), handle('b1', 0)),
+        )
+
+    asyncio.run(run())
+    # a2 waits for a1 even though it is quicker; chat 2 does not
+    assert events.index(('end', 'a1')) < events.index(('start', 'a2'))
+    assert events.index(('end', 'b1')) < events.index(('end', 'a1'))
+    assert processor.locks == {}
+
+
+def test_updates_without_a_chat_are_not_serialized():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=4)
+    running = []
+    peak = []
+
+    async def handle():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def run():
+        bare = SimpleNamespace()
+        await asyncio.gather(*(processor.process_update(bare, handle()) for _ in range(3)))
+
+    asyncio.run(run())
+    assert max(peak) == 3
+    assert processor.locks == {}
+
+
+def test_waiting_chat_does_not_hold_a_slot():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    events = []
+    release = asyncio.Event()
+
+    async def slow(name):
+        events.append(('start', name))
+        await release.wait()
+        events.append(('end', name))
+
+    async def quick(name):
+        events.append(('start', name))
+
+    async def run():
+        first = asyncio.create_task(processor.process_update(update(1), slow('a1')))
+        queued = asyncio.create_task(processor.process_update(update(1), quick('a2')))
+        await asyncio.sleep(0.01)
+        # a2 waits for chat 1's lock, not for one of the two slots
+        await asyncio.wait_for(processor.process_update(update(2), quick('b1')), 1)
+        release.set()
+        await asyncio.gather(first, queued)
+
+    asyncio.run(run())
+    assert events == [('start', 'a1'), ('start', 'b1'), ('end', 'a1'), ('start', 'a2')]
+
+
+def test_limit_applies_across_chats():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    running = []
+    peak = []
+
+    async def handle():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def run():
+        await asyncio.gather(*(processor.process_update(update(chat), handle()) for chat in range(6)))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+    # Only PTB's final process_update wraps ours
+    assert 'process_update' not in PerChatUpdateProcessor.__dict__
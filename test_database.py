@@ -0,0 +1,46 @@
+from database import Database
+
+
+def test_indexes_follow_mutations(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    for uid in (1, 2, 3):
+        db.add_user(uid, f'user{uid}', 'Name')
+    db.ban_user(2)
+    db.mark_unreachable([3])
+
+    assert set(db.get_active_users()) == {'1'}
+    assert set(db.get_banned_users()) == {'2'}
+    stats = db.get_stats()
+    assert (stats['total_users'], stats['active_users'], stats['banned_users'], stats['unreachable_users']) == (3, 1, 1, 1)
+
+    db.unban_user(2)
+    # Talking to the bot again makes a user reachable
+    db.add_user(3, 'user3', 'Name')
+    assert set(db.get_active_users()) == {'1', '2', '3'}
+    assert db.get_stats()['unreachable_users'] == 0
+    db.close()
+
+
+def test_active_users_is_a_copy(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_user(1, 'ann', 'Ann')
+    active = db.get_active_users()
+    active.clear()
+    db.add_user(2, 'bob', 'Bob')
+
+    assert active == {}
+    assert set(db.get_active_users()) == {'1', '2'}
+    db.close()
+
+
+def test_payment_indexes(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    plan = db.add_plan(30, 99, 'pay@upi')
+    first = db.add_pending_payment(1, plan['id'], 'a')
+    second = db.add_pending_payment(2, plan['id'], 'b')
+    db.approve_payment(first['id'])
+
+    assert db.get_pending_payments() == [second]
+    assert db.get_payment(first['id'])['status'] == 'approved'
+    assert db.add_pending_payment(3, 999, 'c') is None
+    db.close()
@@ -0,0 +1,19 @@
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from delivery import FAILED, TRANSIENT, UNREACHABLE, classify_error
+
+
+@pytest.mark.parametrize('error, outcome', [
+    (Forbidden("Forbidden: bot was blocked by the user"), UNREACHABLE),
+    (BadRequest("Chat not found"), UNREACHABLE),
+    (BadRequest("User is deactivated"), UNREACHABLE),
+    (BadRequest("Peer_id_invalid"), UNREACHABLE),
+    (BadRequest("Message is too long"), FAILED),
+    (RetryAfter(5), TRANSIENT),
+    (TimedOut(), TRANSIENT),
+    (NetworkError("Connection reset"), TRANSIENT),
+    (ValueError("boom"), FAILED),
+])
+def test_classify_error(error, outcome):
+    assert classify_error(error) == outcome
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import expiry
+from database import Database
+from expiry import CloneExpiryScheduler
+from outbox import release_outbox
+
+DAY = 86400
+TOKEN = '12345:' + 'a' * 35
+
+
+class FakeJob:
+    def __init__(self, delay):
+        self.delay = delay
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, delay, name=None):
+        self.jobs.append(FakeJob(delay))
+        return self.jobs[-1]
+
+
+class FakeBot:
+    token = 'expiry-test'
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def run_at(scheduler, bot, when, monkeypatch):
+    monkeypatch.setattr(expiry, 'time', SimpleNamespace(time=lambda: when))
+
+    async def run():
+        await scheduler._run(SimpleNamespace(bot=bot))
+        await release_outbox(bot)
+
+    asyncio.run(run())
+
+
+def test_new_clones_are_scheduled_when_added(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_cloned_bot(1, TOKEN, 30)
+    scheduler = CloneExpiryScheduler(db, reminder_days=1)
+    jobs = FakeJobQueue()
+    scheduler.start(jobs)
+    assert 28 * DAY < jobs.jobs[-1].delay <= 29 * DAY
+
+    # Sold after startup: picked up through Database.on_clone_added
+    db.add_cloned_bot(2, TOKEN, 3)
+    assert jobs.jobs[-2].removed
+    assert DAY < jobs.jobs[-1].delay <= 2 * DAY
+    assert len(scheduler.heap) == 4
+
+
+def test_due_clones_expire_in_bulk(tmp_path, monkeypatch):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_cloned_bot(1, TOKEN, 3)
+    db.add_cloned_bot(2, TOKEN, 3)
+    db.add_cloned_bot(3, TOKEN, 10)
+    scheduler = CloneExpiryScheduler(db, reminder_days=0)
+    scheduler.start(FakeJobQueue())
+    stopped = []
+
+    async def listener(user_ids):
+        stopped.extend(user_ids)
+
+    scheduler.add_listener(listener)
+    bot = FakeBot()
+    run_at(scheduler, bot, time.time() + 4 * DAY, monkeypatch)
+
+    assert sorted(stopped) == [1, 2]
+    assert sorted(uid for uid, _ in bot.sent) == [1, 2]
+    assert list(db.get_active_clones()) == ['3']
+
+
+def test_renewed_clone_skips_stale_entries(tmp_path, monkeypatch):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_cloned_bot(1, TOKEN, 3)
+    scheduler = CloneExpiryScheduler(db, reminder_days=0)
+    scheduler.start(FakeJobQueue())
+    db.add_cloned_bot(1, TOKEN, 30)
+
+    run_at(scheduler, FakeBot(), time.time() + 4 * DAY, monkeypatch)
+    assert list(db.get_active_clones()) == ['1']
+
+
+def test_reminder_is_sent_once(tmp_path, monkeypatch):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_cloned_bot(1, TOKEN, 5)
+    scheduler = CloneExpiryScheduler(db, reminder_days=2)
+    scheduler.start(FakeJobQueue())
+    bot = FakeBot()
+    run_at(scheduler, bot, time.time() + 3.5 * DAY, monkeypatch)
+
+    assert [uid for uid, _ in bot.sent] == [1]
+    assert db.data['cloned_bots']['1']['reminded']
+    # A restart does not schedule the reminder again
+    restarted = CloneExpiryScheduler(db, reminder_days=2)
+    restarted.start(FakeJobQueue())
+    assert [entry[1] for entry in restarted.heap] == [expiry.EXPIRE]
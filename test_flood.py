@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+
+import flood
+from flood import FloodGuard
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(flood, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_burst_then_refill(clock):
+    guard = FloodGuard(burst=3, refill=0.5)
+    assert [guard.allow(1) for _ in range(4)] == [True, True, True, False]
+    # Other users have their own bucket
+    assert guard.allow(2)
+
+    clock[0] += 2
+    assert guard.allow(1)
+    assert not guard.allow(1)
+    assert guard.throttled == 2
+
+
+def test_summaries_reset_counts(clock):
+    guard = FloodGuard(burst=1, refill=0.1)
+    for _ in range(4):
+        guard.allow(1)
+    guard.allow(2)
+
+    assert guard.take_summaries() == [(1, 3)]
+    assert guard.take_summaries() == []
+
+
+def test_sweep_keeps_unreported_users(clock):
+    guard = FloodGuard(burst=1, refill=0.1, idle_ttl=60)
+    guard.allow(1)
+    guard.allow(2)
+    guard.allow(2)
+    clock[0] += 61
+    guard.sweep()
+    # User 2 still has a suppressed count waiting for the next summary
+    assert set(guard.entries) == {2}
+
+    guard.take_summaries()
+    guard.sweep()
+    assert guard.entries == {}
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+from telegram.ext import (
+    Application,
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler,
+    filters
+)
+
+from database import Database
+from middleware import BanGate, UpdateTypeGate, allowed_updates
+
+
+async def noop(update, context):
+    pass
+
+
+def application(*handlers):
+    app = Application.builder().token('123456:' + 'a' * 35).updater(None).build()
+    app.add_handler(TypeHandler(Update, noop), group=-1)
+    for handler in handlers:
+        app.add_handler(handler)
+    return app
+
+
+def test_allowed_updates_walks_conversations():
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler('start', noop)],
+        states={1: [MessageHandler(filters.TEXT, noop)]},
+        fallbacks=[]
+    )
+    # The TypeHandler gate alone would have asked for every update type
+    assert allowed_updates(application()) == []
+    assert allowed_updates(application(conversation)) == [Update.MESSAGE]
+    both = application(conversation, CallbackQueryHandler(noop))
+    assert allowed_updates(both) == [Update.CALLBACK_QUERY, Update.MESSAGE]
+
+
+def test_unknown_handler_falls_back_to_all_types():
+    assert allowed_updates(application(InlineQueryHandler(noop))) == sorted(Update.ALL_TYPES)
+
+
+def test_gate_drops_and_counts_other_types():
+    gate = UpdateTypeGate([Update.MESSAGE])
+    message = SimpleNamespace(message=object())
+    edited = SimpleNamespace(edited_message=object())
+
+    asyncio.run(gate(message, None))
+    for _ in range(2):
+        with pytest.raises(ApplicationHandlerStop):
+            asyncio.run(gate(edited, None))
+    assert gate.dropped == {Update.EDITED_MESSAGE: 2}
+
+
+def test_ban_gate_stops_banned_users_only(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    for uid in (1, 2):
+        db.add_user(uid, f'user{uid}', 'Name')
+        db.ban_user(uid)
+    gate = BanGate()
+    context = SimpleNamespace(bot_data={'OWNER_ID': 1, 'db': db})
+
+    def check(user):
+        asyncio.run(gate(SimpleNamespace(effective_user=user), context))
+
+    with pytest.raises(ApplicationHandlerStop):
+        check(SimpleNamespace(id=2))
+    assert gate.rejected == 1
+
+    # The owner is never gated, even if banned by mistake
+    check(SimpleNamespace(id=1))
+    check(SimpleNamespace(id=3))
+    check(None)
+    db.unban_user(2)
+    check(SimpleNamespace(id=2))
+    assert gate.rejected == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+from telegram.error import RetryAfter
+
+from outbox import BROADCAST, GREETING, OWNER, RELAY, Outbox
+
+
+def test_calls_drain_by_priority():
+    box = Outbox(rate=1000, workers=1)
+    order = []
+    gate = asyncio.Event()
+
+    async def send(name):
+        order.append(name)
+        return name
+
+    async def blocked():
+        await gate.wait()
+
+    async def run():
+        first = asyncio.create_task(box.call(BROADCAST, blocked))
+        await asyncio.sleep(0)
+        calls = [
+            asyncio.create_task(box.call(priority, send, name))
+            for priority, name in [(BROADCAST, 'b1'), (GREETING, 'g'), (RELAY, 'r'), (BROADCAST, 'b2'), (OWNER, 'o')]
+        ]
+        await asyncio.sleep(0)
+        gate.set()
+        await first
+        results = await asyncio.gather(*calls)
+        await box.close()
+        return results
+
+    results = asyncio.run(run())
+    assert order == ['o', 'r', 'g', 'b1', 'b2']
+    assert results == ['b1', 'g', 'r', 'b2', 'o']
+    assert box.stats()['sent'] == {'owner': 1, 'relay': 1, 'greeting': 1, 'broadcast': 3}
+
+
+def test_full_queue_sheds_greetings():
+    box = Outbox(rate=1000, workers=1, max_depth=2)
+    gate = asyncio.Event()
+
+    async def blocked():
+        await gate.wait()
+
+    async def send():
+        return 'sent'
+
+    async def run():
+        waiting = [asyncio.create_task(box.call(OWNER, blocked)) for _ in range(3)]
+        await asyncio.sleep(0)
+        shed = await box.call(GREETING, send)
+        gate.set()
+        await asyncio.gather(*waiting)
+        kept = await box.call(GREETING, send)
+        await box.close()
+        return shed, kept
+
+    assert asyncio.run(run()) == (None, 'sent')
+    assert box.stats()['shed']['greeting'] == 1
+
+
+def test_flood_limit_retries_in_place():
+    box = Outbox(rate=1000, workers=1)
+    attempts = []
+
+    async def send():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RetryAfter(0.05)
+        return 'sent'
+
+    async def run():
+        result = await box.call(OWNER, send)
+        await box.close()
+        return result
+
+    assert asyncio.run(run()) == 'sent'
+    assert len(attempts) == 2 and box.retried == 1
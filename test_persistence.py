@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from database import Database
+from persistence import DatabasePersistence
+
+
+def reopen(path, backend):
+    db = Database(file=path, backend=backend)
+    return db, DatabasePersistence(db)
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_state_survives_reopen(tmp_path, backend):
+    path = str(tmp_path / 'data.json')
+
+    async def write(persistence):
+        await persistence.update_conversation('plan', (1, 1), 2)
+        await persistence.update_conversation('broadcast', (1, 1), 0)
+        await persistence.update_user_data(1, {'awaiting_token': 5})
+        await persistence.update_user_data(2, {'selected_plan': 3})
+        await persistence.update_chat_data(-100, {'topic': 'x'})
+
+    db, persistence = reopen(path, backend)
+    asyncio.run(write(persistence))
+    db.close()
+
+    db, persistence = reopen(path, backend)
+    assert asyncio.run(persistence.get_conversations('plan')) == {(1, 1): 2}
+    assert asyncio.run(persistence.get_user_data()) == {1: {'awaiting_token': 5}, 2: {'selected_plan': 3}}
+    assert asyncio.run(persistence.get_chat_data()) == {-100: {'topic': 'x'}}
+    db.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_dropped_and_ended_entries_are_deleted(tmp_path, backend):
+    path = str(tmp_path / 'data.json')
+
+    async def write(persistence):
+        await persistence.update_conversation('plan', (1, 1), 2)
+        await persistence.update_user_data(1, {'awaiting_token': 5})
+        await persistence.update_user_data(2, {'selected_plan': 3})
+
+    async def end(persistence):
+        await persistence.update_conversation('plan', (1, 1), None)
+        await persistence.drop_user_data(1)
+        # An emptied dict is gone too
+        await persistence.update_user_data(2, {})
+
+    db, persistence = reopen(path, backend)
+    asyncio.run(write(persistence))
+    db.close()
+    db, persistence = reopen(path, backend)
+    asyncio.run(end(persistence))
+    db.close()
+
+    db, persistence = reopen(path, backend)
+    assert asyncio.run(persistence.get_conversations('plan')) == {}
+    assert asyncio.run(persistence.get_user_data()) == {}
+    db.close()
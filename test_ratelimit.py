@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from ratelimit import KeyedLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=4)
+    assert all(bucket.try_take() for _ in range(4))
+    assert not bucket.try_take()
+    assert bucket.delay() == pytest.approx(0.5)
+
+    clock[0] += 1
+    assert bucket.try_take()
+    assert bucket.try_take()
+    assert not bucket.try_take()
+
+
+def test_bucket_never_exceeds_burst(clock):
+    bucket = TokenBucket(rate=10, burst=3)
+    clock[0] += 60
+    assert sum(bucket.try_take() for _ in range(10)) == 3
+
+
+def test_pause_hands_out_nothing(clock):
+    bucket = TokenBucket(rate=5)
+    bucket.pause(2)
+    assert not bucket.try_take()
+    assert bucket.delay() == pytest.approx(2)
+    clock[0] += 2.2
+    assert bucket.try_take()
+
+
+def test_keyed_limiter_prunes_full_buckets(clock):
+    limiter = KeyedLimiter(1, burst=1, max_keys=2)
+    limiter.get('a').try_take()
+    limiter.get('b')
+    limiter.get('c')
+    # 'b' was full, 'a' still owes a token
+    assert set(limiter.buckets) == {'a', 'c'}
@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+from database import Database
+from outbox import release_outbox
+from user_handlers import TEXT_LIMIT, forward_to_owner, relay_to_owner
+
+OWNER = 500
+USER = SimpleNamespace(id=7, first_name='Ann <3', username='ann')
+
+
+class FakeBot:
+    token = 'relay-test'
+
+    def __init__(self):
+        self.calls = []
+        self.ids = itertools.count(1000)
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.calls.append(('send_message', chat_id, text))
+        return SimpleNamespace(message_id=next(self.ids))
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, caption=None, parse_mode=None):
+        self.calls.append(('copy_message', chat_id, message_id, caption))
+        return SimpleNamespace(message_id=next(self.ids))
+
+
+def message(text=None, caption=None, attachment=None, video_note=None, sticker=None):
+    async def reply_text(text):
+        replies.append(text)
+
+    replies = []
+    return SimpleNamespace(
+        text=text, text_html=text and f"<i>{text}</i>",
+        caption=caption, caption_html=caption and f"<b>{caption}</b>",
+        effective_attachment=attachment, video_note=video_note, sticker=sticker,
+        chat_id=USER.id, message_id=42, reply_text=reply_text, replies=replies
+    )
+
+
+def relay(msg):
+    bot = FakeBot()
+
+    async def run():
+        sent = await relay_to_owner(bot, OWNER, USER, msg)
+        await release_outbox(bot)
+        return sent
+
+    return bot.calls, [m.message_id for m in asyncio.run(run())]
+
+
+def test_text_goes_in_one_message_with_the_header():
+    calls, sent = relay(message(text='hello'))
+    assert len(calls) == 1 and sent == [1000]
+    name, chat_id, text = calls[0]
+    assert (name, chat_id) == ('send_message', OWNER)
+    assert 'Ann &lt;3' in text and text.endswith('\n<i>hello</i>')
+
+
+def test_media_is_copied_with_the_header_in_its_caption():
+    calls, _ = relay(message(caption='look', attachment=object()))
+    assert len(calls) == 1
+    name, chat_id, message_id, caption = calls[0]
+    assert (name, chat_id, message_id) == ('copy_message', OWNER, 42)
+    assert '<code>7</code>' in caption and caption.endswith('\n<b>look</b>')
+
+    calls, _ = relay(message(attachment=object()))
+    assert calls[0][3].startswith('\n📨 New Message from User')
+
+
+def test_header_then_copy_when_nothing_can_be_merged():
+    for msg in (
+        message(attachment=object(), video_note=object()),
+        message(attachment=object(), sticker=object()),
+        message(text='x' * TEXT_LIMIT),
+        message(caption='y' * 1000, attachment=object()),
+    ):
+        calls, sent = relay(msg)
+        assert [call[0] for call in calls] == ['send_message', 'copy_message']
+        assert 'Content below' in calls[0][2]
+        # The copy keeps the original content and caption untouched
+        assert calls[1][3] is None
+        assert sent == [1000, 1001]
+
+
+def test_every_relayed_message_maps_back(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    bot = FakeBot()
+    context = SimpleNamespace(bot=bot, bot_data={'db': db, 'OWNER_ID': OWNER})
+    msg = message(attachment=object(), sticker=object())
+
+    async def run():
+        await forward_to_owner(context, USER, [msg])
+        await release_outbox(bot)
+
+    asyncio.run(run())
+    assert db.get_user_from_msg(1000) == db.get_user_from_msg(1001) == USER.id
+    assert db.get_stats()['messages_relayed'] == 1
+    # The sender is greeted once
+    assert len(msg.replies) == 1
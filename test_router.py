@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from router import CallbackRouter
+
+
+class FakeQuery:
+    def __init__(self, data, user_id):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append(text)
+
+
+def dispatch(router, data, user_id=1, owner_id=1):
+    query = FakeQuery(data, user_id)
+    context = SimpleNamespace(bot_data={'OWNER_ID': owner_id})
+    asyncio.run(router.dispatch(SimpleNamespace(callback_query=query), context))
+    return query
+
+
+def make_router(calls):
+    def handler(name):
+        async def handle(update, context):
+            calls.append((name, update.callback_query.data))
+        return handle
+
+    router = CallbackRouter()
+    router.route('approve_all', handler('all'))
+    router.prefix('approve_', handler('one'), owner_only=True)
+    router.route('plans', handler('plans'))
+    return router
+
+
+def test_exact_keys_win_over_prefixes():
+    calls = []
+    router = make_router(calls)
+    dispatch(router, 'approve_all')
+    dispatch(router, 'approve_12')
+    dispatch(router, 'plans')
+
+    assert calls == [('all', 'approve_all'), ('one', 'approve_12'), ('plans', 'plans')]
+    assert router.resolve('approve') is None
+    assert router.resolve('plans_1') is None
+
+
+def test_unknown_and_refused_queries_are_answered():
+    calls = []
+    router = make_router(calls)
+    unknown = dispatch(router, 'nope_1')
+    refused = dispatch(router, 'approve_12', user_id=2)
+
+    assert calls == []
+    assert unknown.answers == [None]
+    assert refused.answers == ["⛔️ Owner only"]
+
+
+def test_metrics_count_calls_per_route():
+    router = make_router([])
+    for data in ('approve_1', 'approve_2', 'plans'):
+        dispatch(router, data)
+
+    rows = {row['route']: row for row in router.metrics()}
+    assert set(rows) == {'approve_*', 'plans'}
+    assert (rows['approve_*']['calls'], rows['plans']['calls']) == (2, 1)
+    assert rows['approve_*']['p50'] <= rows['approve_*']['p99']
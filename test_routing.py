@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+import routing
+from database import Database
+from routing import RouteSpill, RouteStore
+
+DAY = 86400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(routing, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_lru_evicts_least_recently_used(clock):
+    evicted = []
+    store = RouteStore({}, max_size=2, on_evict=evicted.append)
+    store.put('1', 10)
+    store.put('2', 20)
+    assert store.get('1') == 10
+    store.put('3', 30)
+
+    assert evicted == ['2']
+    assert list(store.entries) == ['1', '3']
+    assert store.get('2') is None
+    assert store.stats()['evictions'] == 1
+
+
+def test_ttl_expires_unused_routes(clock):
+    store = RouteStore({}, ttl=DAY)
+    store.put('1', 10)
+    store.put('2', 20)
+    clock[0] += DAY / 2
+    assert store.get('2') == 20
+    clock[0] += DAY / 2 + 1
+
+    assert store.get('1') is None
+    assert store.get('2') == 20
+    assert store.stats()['expirations'] == 1
+
+
+def test_evicted_and_expired_routes_spill(tmp_path, clock):
+    spill = RouteSpill(str(tmp_path / 'routes.db'))
+    store = RouteStore({}, max_size=1, ttl=DAY, spill=spill)
+    store.put('1', 10)
+    store.put('2', 20)
+    clock[0] += DAY + 1
+    store.put('3', 30)
+
+    assert list(store.entries) == ['3']
+    assert store.get('1') == 10
+    assert store.get('2') == 20
+    assert store.stats()['spill_hits'] == 2
+    store.close()
+
+
+def test_spill_forgets_after_max_age(tmp_path, clock):
+    path = str(tmp_path / 'routes.db')
+    spill = RouteSpill(path, max_age=30 * DAY)
+    spill.put('1', 10, clock[0])
+    spill.close()
+    clock[0] += 31 * DAY
+
+    assert RouteSpill(path, max_age=30 * DAY).get('1') is None
+
+
+def test_stored_routes_carry_their_age(clock):
+    stored = {}
+    store = RouteStore({}, on_store=lambda key, route: stored.__setitem__(key, list(route)))
+    store.put('1', 10)
+    clock[0] += 5
+    store.get('1')
+    assert stored == {'1': [10, clock[0]]}
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_age_survives_restart(tmp_path, monkeypatch, clock, backend):
+    monkeypatch.setenv('ROUTING_TTL_DAYS', '1')
+    path = str(tmp_path / 'data.json')
+    db = Database(file=path, backend=backend)
+    db.map_message(10, 1)
+    clock[0] += DAY / 2
+    db.map_message(20, 2)
+    db.close()
+
+    # Each restart used to restart every route's TTL
+    clock[0] += DAY / 2 + 1
+    db = Database(file=path, backend=backend)
+    assert db.get_user_from_msg(1) is None
+    assert db.get_user_from_msg(2) == 20
+    db.close()
+
+
+def test_routes_without_age_are_upgraded(clock):
+    entries = {'1': 10, '2': [20, clock[0] - 5]}
+    store = RouteStore(entries, ttl=DAY)
+    assert store.upgraded == 1
+    # Oldest first again, so eviction still starts at the front
+    assert list(entries.items()) == [('2', [20, clock[0] - 5]), ('1', [10, clock[0]])]
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import sqlite3
+
+import pytest
+
+from database import Database
+from storage import JournalStorage, JsonStorage, SqliteStorage, apply_change, migrate_json_to_sqlite, open_storage
+
+TOKEN = '12345:' + 'a' * 35
+
+
+def fill(db):
+    db.add_user(1, 'ann', 'Ann')
+    db.add_user(2, 'bob', 'Bob')
+    db.ban_user(2)
+    plan = db.add_plan(30, 99, 'pay@upi')
+    payment = db.add_pending_payment(1, plan['id'], 'file-id')
+    db.approve_payment(payment['id'])
+    db.add_cloned_bot(1, TOKEN, 30)
+    db.map_message(1, 500)
+    db.count_relay()
+    db.save_handler_data('user_data', 1, {'selected_plan': plan['id']})
+    db.save_conversation('plan', (1, 1), 2)
+
+
+def snapshot(db):
+    return json.loads(json.dumps(db.data))
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_round_trip(tmp_path, backend):
+    path = str(tmp_path / 'data.json')
+    db = Database(file=path, backend=backend)
+    fill(db)
+    expected, stats = snapshot(db), db.get_stats()
+    db.close()
+
+    reopened = Database(file=path, backend=backend)
+    assert reopened.data == expected
+    assert reopened.get_stats() == stats
+    assert reopened.get_user_from_msg(500) == 1
+    reopened.close()
+
+
+def test_sqlite_imports_existing_json(tmp_path):
+    path = str(tmp_path / 'data.json')
+    db = Database(file=path, backend='json')
+    fill(db)
+    expected = snapshot(db)
+    db.close()
+
+    migrated = Database(file=path, backend='sqlite')
+    assert migrated.data == expected
+    assert (tmp_path / 'data.db').exists()
+    migrated.close()
+
+
+def test_sqlite_keeps_one_row_per_record(tmp_path):
+    store = SqliteStorage(str(tmp_path / 'data.db'))
+    store.put('users', '1', {'id': 1})
+    store.put('users', '1', {'id': 1, 'name': 'Ann'})
+    store.put('pending_payments', 7, {'id': 7, 'user_id': 1, 'status': 'pending'})
+    store.delete('users', '1')
+
+    conn = sqlite3.connect(store.path)
+    assert conn.execute('SELECT COUNT(*) FROM users').fetchone() == (0,)
+    assert conn.execute('SELECT user_id, status FROM payments').fetchall() == [(1, 'pending')]
+    conn.close()
+    store.close()
+
+
+def test_migrate_command(tmp_path):
+    source = tmp_path / 'data.json'
+    source.write_text(json.dumps({'users': {'1': {'id': 1}}, 'banned': [3], 'plans': [], 'pending_payments': []}))
+    store = migrate_json_to_sqlite(str(source), str(tmp_path / 'out.db'))
+    data = store.load()
+    assert data['users'] == {'1': {'id': 1}}
+    assert data['banned'] == [3]
+    store.close()
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        open_storage('yaml', str(tmp_path / 'data.json'))
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_json_writes_behind(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = JsonStorage(path, flush_interval=60, flush_every=3)
+    store.save({'users': {}})
+
+    async def change(n):
+        for uid in range(n):
+            store.data['users'][str(uid)] = {'id': uid}
+            store.put('users', str(uid), store.data['users'][str(uid)])
+
+    async def run():
+        store.start()
+        await change(2)
+        # Below flush_every and before the timer: nothing written yet
+        assert read(path) == {'users': {}}
+        assert store.dirty == 2
+        await change(1)
+        assert store.dirty == 0
+
+    asyncio.run(run())
+    store.close()
+    assert read(path) == store.data
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_json_flushes_on_timer(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = JsonStorage(path, flush_interval=0.05, flush_every=500)
+    store.save({'users': {}})
+
+    async def run():
+        store.start()
+        store.data['users']['1'] = {'id': 1}
+        store.put('users', '1', store.data['users']['1'])
+        assert store.dirty == 1
+        await asyncio.sleep(0.2)
+        assert store.dirty == 0
+
+    asyncio.run(run())
+    store.close()
+    assert read(path) == {'users': {'1': {'id': 1}}}
+
+
+def test_json_writes_through_without_interval(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = JsonStorage(path, flush_interval=0)
+    store.save({'users': {}})
+    store.data['users']['1'] = {'id': 1}
+    store.put('users', '1', store.data['users']['1'])
+    assert read(path) == {'users': {'1': {'id': 1}}}
+
+
+def test_journal_replays_after_compaction(tmp_path):
+    path = str(tmp_path / 'data.json')
+    db = Database(file=path, backend='journal')
+    db.store.max_log_bytes = 2000
+    for uid in range(100):
+        db.add_user(uid, f'user{uid}', 'Name')
+    db.ban_user(5)
+    plan = db.add_plan(7, 10, 'pay@upi')
+    db.delete_plan(plan['id'])
+    expected = snapshot(db)
+    # No close(): the log is line buffered, as after a kill
+    assert os.path.getsize(path + '.log') < 2000
+
+    reopened = Database(file=path, backend='journal')
+    assert reopened.data == expected
+    assert reopened.is_banned(5)
+    reopened.close()
+
+
+def test_journal_skips_torn_last_line(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = JournalStorage(path)
+    store.save({'users': {}})
+    store.put('users', '1', {'id': 1})
+    store.close()
+    with open(path + '.log', 'a') as f:
+        f.write('{"op":"put","t":"users","k":"2","v":{"i')
+
+    assert JournalStorage(path).load() == {'users': {'1': {'id': 1}}}
+
+
+def test_apply_change():
+    data = {'banned': [], 'plans': [{'id': 1}]}
+    apply_change(data, 'put', 'banned', 4)
+    apply_change(data, 'put', 'banned', 4)
+    apply_change(data, 'put', 'plans', 2, {'id': 2})
+    apply_change(data, 'put', 'plans', 1, {'id': 1, 'days': 3})
+    apply_change(data, 'del', 'plans', 2)
+    apply_change(data, 'put', 'users', '9', {'id': 9})
+    apply_change(data, 'del', 'users', '9')
+    assert data == {'banned': [4], 'plans': [{'id': 1, 'days': 3}], 'users': {}}
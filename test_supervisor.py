@@ -0,0 +1,68 @@
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from database import Database
+from handlers import plans_command
+from outbox import release_outbox
+from supervisor import ShardSupervisor, shard_of
+
+
+def test_shard_of_is_stable():
+    assert [shard_of(uid, 4) for uid in (1, 2, 3, 123456789)] == [3, 1, 3, 2]
+    # Same answer in another interpreter, whatever its hash seed
+    code = 'from supervisor import shard_of; print([shard_of(uid, 4) for uid in (1, 2, 3, 123456789)])'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), env={'PYTHONHASHSEED': '12345'})
+    assert out.stdout.strip() == '[3, 1, 3, 2]'
+
+
+def test_dead_shard_fails_its_requests_and_forgets_its_clones():
+    supervisor = ShardSupervisor(db=None, shards=4)
+
+    async def run():
+        supervisor.loop = asyncio.get_running_loop()
+        conn, child = multiprocessing.Pipe()
+        supervisor.loop.add_reader(conn.fileno(), lambda: None)
+        mine = supervisor.loop.create_future()
+        other = supervisor.loop.create_future()
+        supervisor.pending = {1: (3, mine), 2: (1, other)}
+        supervisor.running = {1: 'bot_one', 2: 'bot_two', 3: 'bot_three'}
+        supervisor.load[3] = {'running': 2}
+
+        supervisor._drop(3, conn)
+        child.close()
+        with pytest.raises(RuntimeError, match='clone shard 3 stopped'):
+            await mine
+        return other, conn
+
+    other, conn = asyncio.run(run())
+    assert not other.done() and list(supervisor.pending) == [2]
+    # Users 1 and 3 live on shard 3
+    assert supervisor.running == {2: 'bot_two'}
+    assert supervisor.load[3] == {}
+    assert conn.closed
+
+
+def test_plans_command_lists_plans(tmp_path):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_plan(30, 99, 'pay@upi')
+    replies = []
+
+    async def reply_text(text, reply_markup=None):
+        replies.append(reply_markup)
+
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=reply_text))
+    context = SimpleNamespace(bot=SimpleNamespace(token='plans-test'), bot_data={'db': db})
+
+    async def run():
+        await plans_command(update, context)
+        await release_outbox(context.bot)
+
+    asyncio.run(run())
+    assert replies[0].inline_keyboard[0][0].callback_data == 'plan_1'
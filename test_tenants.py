@@ -0,0 +1,49 @@
+import asyncio
+import json
+import os
+
+from tenants import TenantRegistry
+
+
+def test_idle_tenant_is_reused_until_evicted(tmp_path):
+    registry = TenantRegistry(root=str(tmp_path), max_idle=2)
+    closed = []
+
+    async def run():
+        first = registry.acquire(1)
+        first.close = lambda: closed.append(1)
+        # Two holders: the first release keeps it active
+        assert registry.acquire(1) is first
+        registry.release(1)
+        assert registry.stats() == {'active': 1, 'idle': 0}
+        registry.release(1)
+
+        # Waking up again finds the same, still loaded Database
+        assert registry.acquire(1) is first
+        registry.release(1)
+
+        for bot_id in (2, 3):
+            registry.acquire(bot_id).close = lambda bot_id=bot_id: closed.append(bot_id)
+            registry.release(bot_id)
+
+        assert closed == [1]
+        assert list(registry.idle) == [2, 3]
+        assert registry.acquire(1) is not first
+        registry.close_all()
+
+    asyncio.run(run())
+    assert sorted(closed) == [1, 2, 3]
+
+
+def test_tenants_write_separate_files(tmp_path):
+    registry = TenantRegistry(root=str(tmp_path))
+
+    async def run():
+        registry.acquire(1).add_user(10, 'ann', 'Ann')
+        registry.acquire(2).add_user(20, 'bob', 'Bob')
+        registry.close_all()
+
+    asyncio.run(run())
+    for bot_id, uid in ((1, '10'), (2, '20')):
+        with open(os.path.join(str(tmp_path), str(bot_id), 'data.json')) as f:
+            assert list(json.load(f)['users']) == [uid]
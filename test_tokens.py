@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import InvalidToken, NetworkError
+
+import tokens
+import user_handlers
+from database import Database
+from outbox import release_outbox
+from tokens import INVALID, UNKNOWN, VALID, TokenValidator
+from user_handlers import handle_bot_token
+
+GOOD = '11111:' + 'a' * 35
+BAD = '22222:' + 'b' * 35
+FLAKY = '33333:' + 'c' * 35
+DAY = 86400
+
+
+class FakeTelegramBot:
+    """Stands in for telegram.Bot: getMe answers from the token alone."""
+
+    calls = []
+
+    def __init__(self, token, request=None, get_updates_request=None):
+        self.token = token
+
+    async def get_me(self):
+        FakeTelegramBot.calls.append(self.token)
+        if self.token == BAD:
+            raise InvalidToken()
+        if self.token == FLAKY:
+            raise NetworkError("connection reset")
+        return SimpleNamespace(username=f"bot{self.token[:5]}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(tokens, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(tokens, 'Bot', FakeTelegramBot)
+    FakeTelegramBot.calls = []
+    return now
+
+
+def test_malformed_token_costs_no_request(clock):
+    validator = TokenValidator()
+    assert asyncio.run(validator.validate('not-a-token')) == (INVALID, "not a bot token")
+    assert FakeTelegramBot.calls == [] and validator.checks == 0
+
+
+def test_results_are_cached_for_their_ttl(clock):
+    validator = TokenValidator(ok_ttl=60, bad_ttl=10)
+
+    def check(token):
+        return asyncio.run(validator.validate(token))
+
+    assert check(GOOD) == (VALID, 'bot11111')
+    assert check(BAD)[0] == INVALID
+    assert check(FLAKY)[0] == UNKNOWN
+    clock[0] += 9
+    assert check(GOOD)[0] == VALID and check(BAD)[0] == INVALID
+    assert check(FLAKY)[0] == UNKNOWN
+    assert FakeTelegramBot.calls == [GOOD, BAD, FLAKY, FLAKY]
+
+    # The rejection expires first, so a token fixed at @BotFather is seen again
+    clock[0] += 2
+    check(GOOD)
+    check(BAD)
+    assert FakeTelegramBot.calls[-1] == BAD
+    assert validator.hits == 3 and FLAKY not in validator.cache
+
+
+class NoticeBot:
+    token = 'tokens-notice'
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+def test_revalidate_expires_revoked_clones(tmp_path, clock):
+    db = Database(file=str(tmp_path / 'data.json'))
+    db.add_cloned_bot(1, GOOD, 30)
+    db.add_cloned_bot(2, BAD, 30)
+    db.add_cloned_bot(3, FLAKY, 30)
+    bot = NoticeBot()
+
+    async def run():
+        revoked = await TokenValidator().revalidate(db, bot)
+        await release_outbox(bot)
+        return revoked
+
+    assert asyncio.run(run()) == [2]
+    assert bot.sent == [2]
+    # A network error keeps the clone running
+    assert sorted(db.get_active_clones()) == ['1', '3']
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeClones:
+    def __init__(self):
+        self.started = []
+
+    async def start(self, user_id, token, owner_name):
+        self.started.append(user_id)
+        return f"bot{token[:5]}"
+
+
+@pytest.fixture
+def onboarding(tmp_path, monkeypatch):
+    async def validate(token):
+        return VALID, f"bot{token[:5]}"
+
+    monkeypatch.setattr(user_handlers.token_validator, 'validate', validate)
+    db = Database(file=str(tmp_path / 'data.json'))
+    plan = db.add_plan(30, 99, 'pay@upi')
+    clones = FakeClones()
+    bot = SimpleNamespace(id=99999, token='99999:' + 'z' * 35)
+
+    def send(user_id, token):
+        payment = db.add_pending_payment(user_id, plan['id'], 'shot')
+        msg = FakeMessage(token)
+        update = SimpleNamespace(message=msg, effective_user=SimpleNamespace(id=user_id, first_name='Buyer'))
+        context = SimpleNamespace(
+            bot=bot, bot_data={'db': db, 'clones': clones}, user_data={'awaiting_token': payment['id']}
+        )
+
+        async def run():
+            await handle_bot_token(update, context)
+            await release_outbox(bot)
+
+        asyncio.run(run())
+        return msg.replies[-1]
+
+    return SimpleNamespace(db=db, clones=clones, bot=bot, send=send)
+
+
+def test_running_clone_token_is_refused_without_a_claim(onboarding):
+    assert 'is live' in onboarding.send(1, GOOD)
+    assert 'someone else' in onboarding.send(2, GOOD)
+    assert user_handlers.token_claims == {}
+
+    # Once the first clone has expired, the bot is free for the next buyer
+    onboarding.db.expire_clones([1])
+    assert 'is live' in onboarding.send(3, GOOD)
+    assert onboarding.clones.started == [1, 3]
+
+
+def test_claimed_token_is_refused(onboarding):
+    user_handlers.token_claims['11111'] = 1
+    try:
+        assert 'someone else' in onboarding.send(2, GOOD)
+    finally:
+        del user_handlers.token_claims['11111']
+    assert onboarding.clones.started == []
+
+
+def test_own_token_is_refused(onboarding):
+    assert 'token of this bot' in onboarding.send(1, onboarding.bot.token)
+    assert onboarding.clones.started == []
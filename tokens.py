@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import re
+import time
+
+from telegram import Bot
+from telegram.error import InvalidToken
+from telegram.request import HTTPXRequest
+
+from outbox import RELAY, outbox_for
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of a token check
+VALID = 'valid'
+INVALID = 'invalid'
+UNKNOWN = 'unknown'
+
+TOKEN_FORMAT = re.compile(r'^\d{5,20}:[A-Za-z0-9_-]{30,}$')
+
+
+class TokenValidator:
+    """Checks clone bot tokens with getMe, cached and with bounded parallelism.
+
+    Malformed tokens are rejected without a request. Results are cached per
+    token: valid ones for ok_ttl seconds, rejected ones for bad_ttl seconds so
+    a buyer retrying the same wrong token costs nothing. Network trouble is
+    UNKNOWN and never cached, so a Telegram hiccup can't get a clone
+    deactivated.
+    """
+
+    def __init__(self, parallel=8, ok_ttl=3600, bad_ttl=600):
+        self.gate = asyncio.Semaphore(parallel)
+        self.ok_ttl = ok_ttl
+        self.bad_ttl = bad_ttl
+        self.request = HTTPXRequest(connection_pool_size=parallel)
+        # token -> (expires at, outcome, @username or reason)
+        self.cache = {}
+        self.checks = 0
+        self.hits = 0
+
+    async def validate(self, token):
+        """(VALID, username) | (INVALID, reason) | (UNKNOWN, reason)"""
+        if not TOKEN_FORMAT.match(token):
+            return INVALID, "not a bot token"
+
+        cached = self.cache.get(token)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1], cached[2]
+
+        async with self.gate:
+            self.checks += 1
+            try:
+                me = await Bot(token, request=self.request, get_updates_request=self.request).get_me()
+            except InvalidToken:
+                result, ttl = (INVALID, "token was rejected by Telegram"), self.bad_ttl
+            except Exception as e:
+                return UNKNOWN, str(e)
+            else:
+                result, ttl = (VALID, me.username), self.ok_ttl
+
+        if len(self.cache) >= 1024:
+            self._sweep()
+        self.cache[token] = (time.monotonic() + ttl, *result)
+        return result
+
+    async def validate_many(self, tokens):
+        """{token: (outcome, detail)}, checked concurrently up to the parallel limit."""
+        tokens = list(dict.fromkeys(tokens))
+        results = await asyncio.gather(*(self.validate(token) for token in tokens))
+        return dict(zip(tokens, results))
+
+    async def revalidate(self, db, bot):
+        """Deactivate active clones whose token no longer works; returns their buyers."""
+        clones = db.get_active_clones()
+        results = await self.validate_many(clone['bot_token'] for clone in clones.values())
+        revoked = db.expire_clones([
+            int(uid) for uid, clone in clones.items() if results[clone['bot_token']][0] == INVALID
+        ])
+        logger.info(f"🔑 Checked {len(clones)} clone tokens, {len(revoked)} revoked")
+
+        for user_id in revoked:
+            try:
+                await outbox_for(bot).call(
+                    RELAY,
+                    bot.send_message,
+                    user_id,
+                    "⚠️ Your clone bot was stopped: Telegram no longer accepts its token.\n\n"
+                    "Send a message to the owner to get it running again."
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Could not notify {user_id} about revoked token: {e}")
+        return revoked
+
+    def _sweep(self):
+        now = time.monotonic()
+        for token in [t for t, entry in self.cache.items() if entry[0] <= now]:
+            del self.cache[token]
+
+    async def close(self):
+        await self.request.shutdown()
+
+
+token_validator = TokenValidator(
+    parallel=int(os.getenv('TOKEN_CHECK_PARALLEL', '8')),
+    ok_ttl=float(os.getenv('TOKEN_CACHE_TTL', '3600')),
+    bad_ttl=float(os.getenv('TOKEN_NEGATIVE_TTL', '600'))
+)
@@ -1,25 +1,29 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import db
+from database import get_db
+from albums import albums, build_media, describe
+from outbox import GREETING, OWNER, RELAY, outbox_for
+from flood import flood_guard_for
+from tokens import INVALID, UNKNOWN, token_validator
+import html
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bot id -> buyer whose clone of that bot is being started right now
+token_claims = {}
+
 async def user_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     user = update.effective_user
     
-    if db.is_banned(user.id):
-        await update.message.reply_text("⛔️ You are banned from using this bot.")
-        return
-    
     db.add_user(user.id, user.username, user.first_name)
     
-    keyboard = [
-        [InlineKeyboardButton("📩 Send Message to Owner", callback_data="user_send")],
-        [InlineKeyboardButton("🤖 Purchase Bot Clone", callback_data="user_plans")],
-        [InlineKeyboardButton("📋 My Clone Bot", callback_data="user_mybot")],
-        [InlineKeyboardButton("ℹ️ Help", callback_data="user_help")]
-    ]
+    keyboard = [[InlineKeyboardButton("📩 Send Message to Owner", callback_data="user_send")]]
+    if not context.bot_data.get('IS_CLONE'):
+        keyboard.append([InlineKeyboardButton("🤖 Purchase Bot Clone", callback_data="user_plans")])
+        keyboard.append([InlineKeyboardButton("📋 My Clone Bot", callback_data="user_mybot")])
+    keyboard.append([InlineKeyboardButton("ℹ️ Help", callback_data="user_help")])
     
     text = f"""
 👋 Welcome {user.first_name}!
@@ -29,69 +33,132 @@ async def user_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Choose an option below:
 """
     
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(RELAY, update.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+# Telegram limits for message text and media captions
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+def relay_header(user):
+    return f"""
+📨 New Message from User
+━━━━━━━━━━━━━━━━
+👤 Name: {html.escape(user.first_name or '')}
+🆔 ID: <code>{user.id}</code>
+📱 Username: @{user.username or 'None'}
+"""
+
+async def relay_to_owner(bot, owner_id, user, msg):
+    """Deliver msg to the owner with the sender header, in one call where possible.
+    
+    Returns the messages sent to the owner, all of which should map back to user.
+    """
+    header = relay_header(user)
+    outbox = outbox_for(bot)
+    
+    if msg.text:
+        if len(header) + len(msg.text) + 2 <= TEXT_LIMIT:
+            return [await outbox.call(RELAY, bot.send_message, owner_id, f"{header}\n{msg.text_html}", parse_mode='HTML')]
+    elif msg.effective_attachment is not None and not (msg.video_note or msg.sticker):
+        caption = f"{header}\n{msg.caption_html}" if msg.caption else header
+        if len(header) + len(msg.caption or '') + 2 <= CAPTION_LIMIT:
+            return [await outbox.call(
+                RELAY, bot.copy_message, owner_id, msg.chat_id, msg.message_id, caption=caption, parse_mode='HTML'
+            )]
+    
+    # Captionless media (video notes, stickers) or content too long to merge
+    sent = await outbox.call(RELAY, bot.send_message, owner_id, header + "\n💬 Content below:", parse_mode='HTML')
+    content = await outbox.call(RELAY, bot.copy_message, owner_id, msg.chat_id, msg.message_id)
+    return [sent, content]
+
+async def relay_album_to_owner(bot, owner_id, user, messages):
+    """Deliver a whole album with one header and one send_media_group."""
+    items = [item for item in (describe(m) for m in messages) if item]
+    header = relay_header(user)
+    outbox = outbox_for(bot)
+    
+    first = messages[0].caption or ''
+    if len(header) + len(first) + 2 <= CAPTION_LIMIT:
+        caption = f"{header}\n{items[0]['caption']}" if items[0]['caption'] else header
+        return list(await outbox.call(RELAY, bot.send_media_group, owner_id, build_media(items, first_caption=caption)))
+    
+    sent = await outbox.call(RELAY, bot.send_message, owner_id, header + "\n💬 Album below:", parse_mode='HTML')
+    return [sent] + list(await outbox.call(RELAY, bot.send_media_group, owner_id, build_media(items)))
 
 async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     user = update.effective_user
     msg = update.message
     
-    if db.is_banned(user.id):
+    db.add_user(user.id, user.username, user.first_name)
+    
+    # Over the per-user limit: counted for the next flood summary instead of relayed
+    if not flood_guard_for(context.bot).allow(user.id):
         return
     
-    db.add_user(user.id, user.username, user.first_name)
+    # Album parts arrive one update each; forward them together once complete
+    if msg.media_group_id:
+        albums.start(msg, lambda messages: forward_to_owner(context, user, messages))
+        return
+    
+    await forward_to_owner(context, user, [msg])
+
+async def forward_to_owner(context: ContextTypes.DEFAULT_TYPE, user, messages):
+    db = get_db(context)
+    msg = messages[0]
     owner_id = int(context.bot_data.get('OWNER_ID'))
     
     try:
-        # Send header to owner
-        header = f"""
-📨 New Message from User
-━━━━━━━━━━━━━━━━
-👤 Name: {user.first_name}
-🆔 ID: <code>{user.id}</code>
-📱 Username: @{user.username or 'None'}
-
-💬 Content below:
-"""
-        sent = await context.bot.send_message(owner_id, header, parse_mode='HTML')
-        db.map_message(user.id, sent.message_id)
+        if len(messages) > 1:
+            sent_messages = await relay_album_to_owner(context.bot, owner_id, user, messages)
+        else:
+            sent_messages = await relay_to_owner(context.bot, owner_id, user, msg)
+        for sent in sent_messages:
+            db.map_message(user.id, sent.message_id)
         
-        # Forward actual content
-        if msg.text:
-            content = await context.bot.send_message(owner_id, msg.text)
-            db.map_message(user.id, content.message_id)
-        elif msg.photo:
-            content = await context.bot.send_photo(owner_id, msg.photo[-1].file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.video:
-            content = await context.bot.send_video(owner_id, msg.video.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.document:
-            content = await context.bot.send_document(owner_id, msg.document.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.voice:
-            content = await context.bot.send_voice(owner_id, msg.voice.file_id)
-            db.map_message(user.id, content.message_id)
-        elif msg.audio:
-            content = await context.bot.send_audio(owner_id, msg.audio.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.video_note:
-            content = await context.bot.send_video_note(owner_id, msg.video_note.file_id)
-            db.map_message(user.id, content.message_id)
+        db.count_relay()
         
-        # Random greeting
+        # Random greeting (the first thing dropped when the outbox is backed up)
         greeting = db.get_random_greeting()
-        await msg.reply_text(greeting)
+        await outbox_for(context.bot).call(GREETING, msg.reply_text, greeting)
         
         logger.info(f"✅ Message from user {user.id} forwarded to owner")
         
     except Exception as e:
         logger.error(f"❌ Error forwarding message: {e}")
-        await msg.reply_text("❌ Failed to send message. Please try again.")
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, "❌ Failed to send message. Please try again.")
+
+async def flood_summary_job(context: ContextTypes.DEFAULT_TYPE):
+    """Tell the owner how many messages each flooding user had held back."""
+    db = get_db(context)
+    guard = flood_guard_for(context.bot)
+    owner_id = int(context.bot_data.get('OWNER_ID'))
+    
+    for uid, count in guard.take_summaries():
+        user = db.get_user(uid)
+        name = html.escape(user['name'] or '') if user else 'Unknown'
+        try:
+            sent = await outbox_for(context.bot).call(
+                RELAY,
+                context.bot.send_message,
+                owner_id,
+                f"🌊 {name} (<code>{uid}</code>) sent {count} more message{'s' if count > 1 else ''} "
+                f"that {'were' if count > 1 else 'was'} not forwarded (flood limit).",
+                parse_mode='HTML'
+            )
+            # Replying to the summary reaches the user like any relayed message
+            db.map_message(uid, sent.message_id)
+        except Exception as e:
+            logger.error(f"❌ Error sending flood summary: {e}")
+    
+    guard.sweep()
 
 async def user_send_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    await query.message.reply_text(
+    await outbox_for(context.bot).call(
+        RELAY,
+        query.message.reply_text,
         "📝 Send your message now:\n\n"
         "You can send:\n"
         "• Text messages\n"
@@ -103,13 +170,14 @@ async def user_send_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 async def user_plans_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     plans = db.get_plans()
     
     if not plans:
-        await query.message.reply_text("📋 No subscription plans available yet.\n\nPlease check back later!")
+        await outbox_for(context.bot).call(RELAY, query.message.reply_text, "📋 No subscription plans available yet.\n\nPlease check back later!")
         return
     
     text = "🤖 Clone Bot Subscription Plans\n━━━━━━━━━━━━━━━━\n\nChoose a plan:\n"
@@ -119,14 +187,14 @@ async def user_plans_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         button_text = f"{plan['days']} Day{'s' if plan['days'] > 1 else ''} - ₹{plan['price']}"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=f"plan_{plan['id']}")])
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(RELAY, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def plan_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     plan_id = int(query.data.split('_')[1])
     
-    plans = db.get_plans()
-    plan = next((p for p in plans if p['id'] == plan_id), None)
+    plan = db.get_plan(plan_id)
     
     if not plan:
         await query.answer("❌ Plan not found!", show_alert=True)
@@ -162,13 +230,14 @@ async def plan_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]
     ]
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await outbox_for(context.bot).call(RELAY, query.message.reply_text, text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     # Store plan selection
     context.user_data['selected_plan'] = plan_id
 
 async def handle_payment_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment screenshot from user"""
+    db = get_db(context)
     if 'selected_plan' not in context.user_data:
         return
     
@@ -186,7 +255,9 @@ async def handle_payment_screenshot(update: Update, context: ContextTypes.DEFAUL
     
     if payment:
         # Notify user
-        await msg.reply_text(
+        await outbox_for(context.bot).call(
+            RELAY,
+            msg.reply_text,
             "✅ Payment screenshot received!\n\n"
             "🔍 Your payment is under review.\n"
             "⏳ Please wait for owner approval.\n\n"
@@ -214,7 +285,9 @@ Payment ID: #{payment['id']}
             ]
         ]
         
-        await context.bot.send_photo(
+        await outbox_for(context.bot).call(
+            OWNER,
+            context.bot.send_photo,
             owner_id,
             screenshot,
             caption=owner_text,
@@ -227,9 +300,10 @@ Payment ID: #{payment['id']}
         
         logger.info(f"💳 Payment screenshot from user {user.id} sent to owner")
     else:
-        await msg.reply_text("❌ Error processing payment. Please try again.")
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, "❌ Error processing payment. Please try again.")
 
 async def user_mybot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
@@ -237,7 +311,9 @@ async def user_mybot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     clone = db.get_cloned_bot(user_id)
     
     if not clone:
-        await query.message.reply_text(
+        await outbox_for(context.bot).call(
+            RELAY,
+            query.message.reply_text,
             "�� You don't have an active clone bot.\n\n"
             "Purchase a plan to get your own bot!"
         )
@@ -247,10 +323,13 @@ async def user_mybot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     expiry = datetime.fromisoformat(clone['expiry'])
     days_left = (expiry - datetime.now()).days
     
+    username = context.bot_data['clones'].username(user_id)
+    status = f"✅ Running as @{username}" if username else "⚠️ Not running, contact the owner"
+    
     text = f"""
 🤖 Your Clone Bot
 ━━━━━━━━━━━━━━━━
-✅ Status: Active
+{status}
 📅 Days Left: {days_left}
 ⏰ Expires: {expiry.strftime('%Y-%m-%d')}
 
@@ -259,15 +338,25 @@ async def user_mybot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 ✅ Receive messages from users
 ✅ Reply to user messages
 
-Your bot is running! Users can start it and send you messages.
+Open your bot and send /start for your owner panel. Users can start it and send you messages.
 """
     
-    await query.message.reply_text(text)
+    await outbox_for(context.bot).call(RELAY, query.message.reply_text, text)
 
 async def user_help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    if context.bot_data.get('IS_CLONE'):
+        await outbox_for(context.bot).call(
+            RELAY,
+            query.message.reply_text,
+            "ℹ️ Help & Information\n"
+            "━━━━━━━━━━━━━━━━\n\n"
+            "Send any message, photo, video, or document here and the owner will receive it."
+        )
+        return
+    
     text = """
 ℹ️ Help & Information
 ━━━━━━━━━━━━━━━━
@@ -294,7 +383,58 @@ async def user_help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 Need help? Send a message to the owner!
 """
     
-    await query.message.reply_text(text)
+    await outbox_for(context.bot).call(RELAY, query.message.reply_text, text)
+
+async def handle_bot_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start the clone bot of an approved buyer from the token they send."""
+    db = get_db(context)
+    msg = update.message
+    user = update.effective_user
+    
+    payment = db.get_payment(context.user_data['awaiting_token'])
+    token = msg.text.strip()
+    bot_id = token.split(':')[0]
+    
+    # A second poller on this bot's token would knock it offline (409 Conflict)
+    if bot_id == str(context.bot.id):
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, "❌ That is the token of this bot. Create your own bot with @BotFather and send its token:")
+        return
+    
+    outcome, detail = await token_validator.validate(token)
+    if outcome == INVALID:
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, f"❌ This token doesn't work ({detail}). Copy it again from @BotFather and send it here:")
+        return
+    if outcome == UNKNOWN:
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, "⏳ Couldn't reach Telegram to check the token. Please send it again in a minute.")
+        return
+    
+    # Check and claim with no await in between, so two buyers sending the same
+    # token at once can't both get past this. A token that is already running
+    # is refused before the claim, which would otherwise never be released
+    owner = db.get_clone_owner(token)
+    if (owner is not None and owner != user.id) or token_claims.setdefault(bot_id, user.id) != user.id:
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, f"❌ @{detail} is already running as someone else's clone. Create a new bot with @BotFather:")
+        return
+    
+    try:
+        username = await context.bot_data['clones'].start(user.id, token, user.first_name)
+    except Exception as e:
+        logger.warning(f"⚠️ Clone of user {user.id} failed to start: {e}")
+        await outbox_for(context.bot).call(RELAY, msg.reply_text, "❌ Your bot could not be started. Please send the token again:")
+        return
+    else:
+        db.add_cloned_bot(user.id, token, payment['plan_days'])
+    finally:
+        del token_claims[bot_id]
+    del context.user_data['awaiting_token']
+    
+    await outbox_for(context.bot).call(
+        RELAY,
+        msg.reply_text,
+        f"🎉 Your clone bot @{username} is live!\n\n"
+        f"Open it and send /start to get your owner panel."
+    )
+    logger.info(f"🤖 Clone @{username} started for user {user.id}")
 
 async def cancel_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -303,4 +443,4 @@ async def cancel_payment_callback(update: Update, context: ContextTypes.DEFAULT_
     if 'selected_plan' in context.user_data:
         del context.user_data['selected_plan']
     
-    await query.message.reply_text("❌ Payment cancelled. Use /start to try again.")
+    await outbox_for(context.bot).call(RELAY, query.message.reply_text, "❌ Payment cancelled. Use /start to try again.")